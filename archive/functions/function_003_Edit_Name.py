@@ -1,4 +1,5 @@
 from utils.log_util import *
 
 def main():
+    rate_limiter.acquire("edit_name")
     LOGI("Running new function: File name: function_003.py")
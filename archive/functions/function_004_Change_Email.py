@@ -1,4 +1,7 @@
 from utils.log_util import *
 
+# Must finish before this function starts
+DEPENDS = ["function_002_Change_Login_Email"]
+
 def main():
     LOGI("Running new function: File name: function_004.py")
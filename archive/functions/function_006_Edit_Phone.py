@@ -1,4 +1,5 @@
 from utils.log_util import *
 
 def main():
+    rate_limiter.acquire("edit_phone")
     LOGI("Running new function: File name: function_006.py")
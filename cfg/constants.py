@@ -16,3 +16,118 @@ DEFAULT_WINDOW_SIZE = {"width": 800, "height": 600}
 
 # Sort options list for "Sort by option"
 SORT_OPTIONS = ["Sort Alphabet", "Move Checked to Top"]
+
+
+# Maximum number of loaded function modules kept in memory
+MODULE_CACHE_SIZE = 128
+
+
+# "Run All" execution: "serial", "thread", "process" or "prefork", and max concurrency
+RUN_MODES = ["serial", "thread", "process", "prefork"]
+RUN_ALL_MODE = "thread"
+RUN_ALL_MAX_WORKERS = 8
+
+
+# Maximum number of "async def main()" functions awaited at the same time
+ASYNC_MAX_CONCURRENCY = 100
+
+
+# Account list the functions run over, and how many rows are run per chunk
+ACCOUNTS_FILE = "accounts.xlsx"
+ACCOUNT_ID_FIELD = "phone"
+ACCOUNT_CHUNK_SIZE = 500
+
+
+# Opt-in cache of function results (scripts set RESULT_TTL = seconds)
+RESULT_CACHE_FILE = "cache/result_cache.pickle"
+RESULT_CACHE_SIZE = 10000
+
+
+# Prefork workers: modules imported once per worker, and recycling limits
+WORKER_PRELOAD_MODULES = ["openpyxl", "telethon"]
+WORKER_MAX_JOBS = 1000
+WORKER_MAX_RSS_MB = 512
+
+
+# Default per-run timeout in seconds (None: no limit; scripts override with TIMEOUT),
+# and how many account runs may be queued or in flight at once
+RUN_TIMEOUT = None
+RUN_QUEUE_SIZE = 1000
+
+
+# Token bucket limits per API operation: "rate" (calls/s) and "burst" per account,
+# optional "global_rate"/"global_burst" across accounts; the file overrides these
+RATE_LIMITS_FILE = "rate_limits.json"
+RATE_LIMITS = {"default": {"rate": 1.0, "burst": 5}}
+RATE_LIMIT_MAX_BUCKETS = 100000
+
+
+# Asynchronous logging: queued records, records written per batch, and what to do
+# when the queue is full: "block", "drop" or "drop_low" (drop below WARN only)
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+LOG_QUEUE_OVERFLOW = "block"
+
+
+# Log files are rotated past LOG_MAX_BYTES or LOG_ROTATE_INTERVAL seconds (None: never),
+# keeping LOG_BACKUP_COUNT gzipped segments; LOG_JSON_FILE is written with --logjson
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_INTERVAL = None
+LOG_BACKUP_COUNT = 10
+LOG_JSON_FILE = "logs/log_file.jsonl"
+
+
+# Profiling (--profile): report files prefix and latency samples kept per function
+PROFILE_OUTPUT = "logs/profile"
+PROFILE_MAX_SAMPLES = 10000
+
+
+# Log volume: default messages per second written from one call site below WARN
+# (0: no limit; a call can pass rate=R), and idle seconds before
+# "last message repeated N times" is written
+LOG_SITE_RATE_LIMIT = 0
+LOG_REPEAT_FLUSH_INTERVAL = 1.0
+
+
+# Suffix of the sidecar index built by the "logs" search command
+LOG_INDEX_SUFFIX = ".idx"
+
+
+# Console log output (--noconsole turns it off): characters buffered and seconds
+# between flushes when stdout is not a terminal
+LOG_CONSOLE = True
+LOG_CONSOLE_BUFFER_SIZE = 64 * 1024
+LOG_CONSOLE_FLUSH_INTERVAL = 0.5
+
+
+# SQLite state store of the function order, check states, window size and
+# settings; ORDER_FILE and WINDOW_SIZE_FILE are imported when it is created
+STATE_DB_FILE = "state.db"
+
+
+# Watcher of the functions directory: seconds without new changes before
+# they are applied, and the poll interval when inotify is not available
+WATCH_DEBOUNCE = 0.3
+WATCH_POLL_INTERVAL = 1.0
+WATCH_UI_INTERVAL_MS = 200
+
+
+# Index of the function scripts' metadata (docstring, main(), TAGS, imports),
+# parsed on a process pool when at least METADATA_PARALLEL_MIN scripts changed
+METADATA_INDEX_FILE = "cache/function_metadata.json"
+METADATA_PARALLEL_MIN = 200
+
+
+# Zip bundle of the compiled function scripts ("main bundle"); used for the
+# scripts that did not change since it was built
+FUNCTIONS_BUNDLE = "cache/functions.zip"
+
+
+# Intent journal of a function rename batch, completed on the next start
+# if the app stopped in the middle of it
+RENAME_JOURNAL_FILE = os.path.join(FUNCTIONS_DIR, ".rename_journal.json")
+
+
+# Seconds between a UI state change (order, names, check states, window
+# size) and its background save; at most this much is lost on a crash
+AUTOSAVE_INTERVAL = 1.0
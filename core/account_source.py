@@ -0,0 +1,83 @@
+import csv
+import itertools
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from cfg.constants import ACCOUNT_ID_FIELD
+from utils.log_util import *
+
+
+def _rows_to_accounts(rows: Iterable[Iterable[Any]]) -> Iterator[Dict[str, Any]]:
+    """Turn raw rows into dicts keyed by the header row, skipping empty rows."""
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [str(c).strip() if c is not None else "" for c in header]
+    for row in rows:
+        values = list(row)
+        if all(v is None or v == "" for v in values):
+            continue
+        yield dict(zip(columns, values))
+
+
+def _iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream accounts from a CSV file."""
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        yield from _rows_to_accounts(csv.reader(f))
+
+
+def _iter_excel(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream accounts from the first sheet of a workbook in read-only mode."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        yield from _rows_to_accounts(sheet.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+@log_entry_exit
+def iter_accounts(path: str) -> Iterator[Dict[str, Any]]:
+    """Lazily yield one dict per account row of an Excel or CSV file.
+
+    Workbooks need openpyxl; without it, a CSV file with the same name is
+    used instead if one exists.
+    """
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".csv":
+        LOGD(f"Streaming accounts from CSV file {path}")
+        return _iter_csv(path)
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        csv_path = stem + ".csv"
+        if not os.path.exists(csv_path):
+            raise ImportError(
+                f"openpyxl is required to read {path} (or provide {csv_path})"
+            )
+        LOGW(f"openpyxl is not installed, reading accounts from {csv_path}")
+        return _iter_csv(csv_path)
+    LOGD(f"Streaming accounts from workbook {path}")
+    return _iter_excel(path)
+
+
+def iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield successive lists of at most size items without reading ahead."""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def account_id(account: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Return the identifier of an account row (ACCOUNT_ID_FIELD or first column)."""
+    if not account:
+        return None
+    value = account.get(ACCOUNT_ID_FIELD)
+    if value is None:
+        value = next(iter(account.values()))
+    return None if value is None else str(value)
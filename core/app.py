@@ -2,7 +2,9 @@ import tkinter as tk
 from typing import Optional
 from gui.ui import UI
 from core.function_manager import FunctionManager
+from core.autosave import AutoSaver
 from core.file_handler import FileHandler
+from core.state_store import get_state_store
 from gui.utils.tooltip import Tooltip
 from utils.log_util import *
 
@@ -11,17 +13,35 @@ class FunctionRunnerApp:
     """Main application class for the Function Runner GUI."""
 
     @log_entry_exit
-    def __init__(self, root: tk.Tk):
+    def __init__(
+        self,
+        root: tk.Tk,
+        run_mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        async_limit: Optional[int] = None,
+        use_result_cache: bool = False,
+        timeout: Optional[float] = None,
+    ):
         self.root = root
         self.root.title("Function Runner App")
         self.edit_mode: bool = False
         self.selected_row: Optional[int] = None
         self.is_sorted_asc: bool = True
+        self.run_mode = run_mode
+        self.max_workers = max_workers
+        self.async_limit = async_limit
+        self.use_result_cache = use_result_cache
+        self.timeout = timeout
+        self.autosaver = AutoSaver()
+        self._dirty: set = set()
+        self._capture_pending = False
         self.function_manager = FunctionManager(self)
         self.ui = UI(root, self)
         self.load_window_size()
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.bind("<Configure>", self._on_configure, add="+")
         self.function_manager.load_functions()
+        self.function_manager.start_watching()
 
     @log_entry_exit
     def load_window_size(self) -> None:
@@ -29,11 +49,60 @@ class FunctionRunnerApp:
         width, height = FileHandler.load_window_size()
         self.root.geometry(f"{width}x{height}")
 
+    def mark_dirty(self, part: str) -> None:
+        """Note that part of the state ("functions", "window" or "metadata") changed.
+
+        The changed parts are autosaved soon.
+        """
+        self._dirty.add(part)
+        if not self._capture_pending:
+            # One snapshot per burst of changes, taken once Tk is idle
+            self._capture_pending = True
+            self.root.after_idle(self._capture_dirty)
+
+    def _capture_dirty(self) -> None:
+        """Snapshot the changed state on the Tk thread and hand it to the autosaver."""
+        self._capture_pending = False
+        dirty, self._dirty = self._dirty, set()
+        if "functions" in dirty:
+            self.autosaver.submit(
+                "functions",
+                FileHandler.save_function_states,
+                FileHandler.function_states(self.function_manager.function_rows),
+            )
+        if "window" in dirty:
+            self.autosaver.submit(
+                "window",
+                lambda size: FileHandler.save_window_size(*size),
+                (self.root.winfo_width(), self.root.winfo_height()),
+            )
+        if "metadata" in dirty:
+            # The index copies its entries itself, in the autosave thread
+            self.autosaver.submit(
+                "metadata", lambda _: self.function_manager.metadata.save(), None
+            )
+
+    def save_state(self) -> None:
+        """Write the changed state now and wait until it is saved."""
+        self._capture_dirty()
+        self.autosaver.flush()
+
+    def _on_configure(self, event) -> None:
+        """Autosave the window size when the main window is resized."""
+        if event.widget is self.root:
+            self.mark_dirty("window")
+
     @log_entry_exit
     def on_close(self) -> None:
         """Handle window close event."""
-        FileHandler.save_window_size(self.root.winfo_width(), self.root.winfo_height())
+        self.function_manager.stop_watching()
         self.function_manager.save_order_and_names()
+        self._dirty.add("window")
+        self.save_state()
+        self.autosaver.stop()
+        LOGI(f"Module cache stats: {self.function_manager.runner.module_cache.stats()}")
+        self.function_manager.runner.close()
+        get_state_store().close()
         self.root.destroy()
 
     @log_entry_exit
@@ -0,0 +1,57 @@
+import asyncio
+import atexit
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+from utils.log_util import *
+
+
+class BackgroundLoop:
+    """A long-lived asyncio event loop running in a daemon thread."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @log_entry_exit
+    def start(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread if it is not running yet and return the loop."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="async_loop", daemon=True
+                )
+                self._thread.start()
+                LOGD("Started background event loop")
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the loop from any other thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block until it finishes."""
+        return self.submit(coro).result(timeout)
+
+    @log_entry_exit
+    def stop(self) -> None:
+        """Stop the loop and wait for its thread to exit."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            LOGD("Stopped background event loop")
+
+
+# The loop shared by every async function script
+_gBackgroundLoop = BackgroundLoop()
+atexit.register(_gBackgroundLoop.stop)
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Return the process-wide background event loop."""
+    return _gBackgroundLoop
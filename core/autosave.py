@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from cfg.constants import AUTOSAVE_INTERVAL
+from utils.log_util import *
+
+
+class AutoSaver:
+    """Background writer of app state snapshots.
+
+    submit() hands over a snapshot and the function that saves it, keyed
+    by the part of the state it covers. Snapshots of the same key are
+    coalesced (only the newest is written), and pending snapshots are
+    written AUTOSAVE_INTERVAL seconds after the first one came in, so the
+    caller never waits for disk I/O and at most that much is lost on a
+    crash.
+    """
+
+    @log_entry_exit
+    def __init__(self, interval: float = AUTOSAVE_INTERVAL):
+        self.interval = interval
+        self.saves = 0
+        self._pending: Dict[str, Tuple[Callable[[Any], None], Any]] = {}
+        self._deadline: Optional[float] = None
+        self._stopped = False
+        self._writing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: str, save: Callable[[Any], None], snapshot: Any) -> None:
+        """Queue save(snapshot), replacing a pending snapshot of the same key."""
+        with self._cond:
+            self._pending[key] = (save, snapshot)
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.interval
+                self._cond.notify()
+
+    def _run(self) -> None:
+        """Write the pending snapshots whenever their deadline passes."""
+        while True:
+            with self._cond:
+                while not self._stopped and (
+                    self._deadline is None or time.monotonic() < self._deadline
+                ):
+                    timeout = None if self._deadline is None else self._deadline - time.monotonic()
+                    self._cond.wait(timeout)
+                if self._stopped and not self._pending:
+                    return
+                pending, self._pending, self._deadline = self._pending, {}, None
+                self._writing = True
+            self._write(pending)
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def _write(self, pending: Dict[str, Tuple[Callable[[Any], None], Any]]) -> None:
+        """Save each snapshot; a failing save is logged and does not stop the others."""
+        for key, (save, snapshot) in pending.items():
+            try:
+                save(snapshot)
+                self.saves += 1
+            except Exception as e:
+                LOGE(f"Autosave of {key} failed: {e!r}")
+        LOGD(f"Autosaved {', '.join(pending)}")
+
+    @log_entry_exit
+    def flush(self) -> None:
+        """Write the pending snapshots now and wait until they are saved."""
+        with self._cond:
+            if self._pending:
+                self._deadline = time.monotonic()
+                self._cond.notify_all()
+            while (self._pending or self._writing) and self._thread.is_alive():
+                self._cond.wait(0.1)
+
+    @log_entry_exit
+    def stop(self) -> None:
+        """Write what is pending and stop the writer thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
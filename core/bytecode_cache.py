@@ -0,0 +1,173 @@
+import compileall
+import importlib.util
+import json
+import marshal
+import os
+import queue
+import threading
+import zipfile
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+from cfg.constants import FUNCTIONS_BUNDLE, FUNCTIONS_DIR
+from utils.log_util import *
+
+
+# Bundle entry listing the source signature of every compiled script
+_MANIFEST = "manifest.json"
+
+
+class BytecodeCompiler:
+    """Background compiler of the function scripts into their __pycache__ bytecode.
+
+    The module cache loads scripts with the standard source loader, which
+    reuses up-to-date __pycache__ files, so a precompiled script skips
+    parsing and compiling on its first run. Scripts whose bytecode is
+    current are skipped.
+    """
+
+    @log_entry_exit
+    def __init__(self, functions_dir: str = FUNCTIONS_DIR):
+        self.functions_dir = functions_dir
+        self.compiled = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, filenames: Optional[List[str]] = None) -> None:
+        """Queue scripts for compilation, all of them if no names are given."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="bytecode_compiler", daemon=True
+            )
+            self._thread.start()
+        self._queue.put(filenames)
+
+    def stop(self) -> None:
+        """Stop the compiler thread once the queued work is done."""
+        if self._thread is not None:
+            self._queue.put(False)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        """Compile queued scripts until stopped."""
+        while True:
+            filenames = self._queue.get()
+            if filenames is False:
+                return
+            if filenames is None:
+                try:
+                    filenames = [f for f in os.listdir(self.functions_dir) if f.endswith(".py")]
+                except OSError:
+                    continue
+            compiled = 0
+            for filename in filenames:
+                filepath = os.path.join(self.functions_dir, filename)
+                if not os.path.isfile(filepath):
+                    continue
+                cache_path = importlib.util.cache_from_source(filepath)
+                before = _mtime_ns(cache_path)
+                # quiet=2: syntax errors are reported when the script runs
+                if compileall.compile_file(filepath, quiet=2) and _mtime_ns(cache_path) != before:
+                    compiled += 1
+            if compiled:
+                self.compiled += compiled
+                LOGD(f"Precompiled {compiled} function script(s)")
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    """Return the mtime of a file, or None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+@log_entry_exit
+def build_bundle(functions_dir: str = FUNCTIONS_DIR, bundle_path: str = FUNCTIONS_BUNDLE) -> int:
+    """Compile every function script into one zip bundle; return the number of scripts.
+
+    Scripts that do not compile are left out and load from source. The
+    bundle is replaced atomically.
+    """
+    directory = os.path.dirname(bundle_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    manifest = {"magic": importlib.util.MAGIC_NUMBER.hex(), "scripts": {}}
+    tmp_path = bundle_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as bundle:
+        with os.scandir(functions_dir) as it:
+            for item in sorted(it, key=lambda item: item.name):
+                if not item.name.endswith(".py") or not item.is_file():
+                    continue
+                stat = item.stat()
+                with open(item.path, "rb") as f:
+                    source = f.read()
+                try:
+                    code = compile(source, item.path, "exec", dont_inherit=True)
+                except (SyntaxError, ValueError) as e:
+                    LOGW(f"Not bundling {item.name}: {e}")
+                    continue
+                bundle.writestr(item.name + "c", marshal.dumps(code))
+                manifest["scripts"][item.name] = [stat.st_mtime_ns, stat.st_size]
+        bundle.writestr(_MANIFEST, json.dumps(manifest))
+    os.replace(tmp_path, bundle_path)
+    LOGI(f"Bundled {len(manifest['scripts'])} function script(s) into {bundle_path}")
+    return len(manifest["scripts"])
+
+
+class FunctionBundle:
+    """Read side of the zip bundle of compiled function scripts.
+
+    The zip is opened once, so loading a script reads one archive instead
+    of its own source or bytecode file. A script is served from the bundle
+    only while its source signature matches the one it was bundled with;
+    changed scripts fall back to their source. The bundle is reopened when
+    it is rebuilt.
+    """
+
+    def __init__(self, path: str = FUNCTIONS_BUNDLE):
+        self.path = path
+        self.hits = 0
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._scripts: Dict[str, List[int]] = {}
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        """Open the bundle, or reopen it if it changed on disk; the caller holds the lock."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stamp = None
+        else:
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        if self._zip is not None:
+            self._zip.close()
+        self._zip, self._scripts, self._stamp = None, {}, stamp
+        if stamp is None:
+            return
+        try:
+            bundle = zipfile.ZipFile(self.path)
+            manifest = json.loads(bundle.read(_MANIFEST))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            LOGW(f"Ignoring unreadable function bundle {self.path}: {e}")
+            return
+        if manifest.get("magic") != importlib.util.MAGIC_NUMBER.hex():
+            LOGW(f"Ignoring function bundle {self.path} built by another Python version")
+            bundle.close()
+            return
+        self._zip, self._scripts = bundle, manifest["scripts"]
+        LOGD(f"Opened function bundle {self.path} ({len(self._scripts)} script(s))")
+
+    def code_for(self, filepath: str, signature: Tuple[int, int]) -> Optional[CodeType]:
+        """Return the bundled code of a script if it matches the source signature, else None."""
+        name = os.path.basename(filepath)
+        with self._lock:
+            self._refresh()
+            if self._zip is None or self._scripts.get(name) != list(signature):
+                return None
+            data = self._zip.read(name + "c")
+            self.hits += 1
+        return marshal.loads(data)
@@ -1,59 +1,100 @@
-import json
 import os
-from typing import List, Dict
-from cfg.constants import ORDER_FILE, WINDOW_SIZE_FILE, DEFAULT_WINDOW_SIZE, FUNCTIONS_DIR
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
+from cfg.constants import DEFAULT_WINDOW_SIZE, FUNCTIONS_DIR
+from core.state_store import get_state_store
 from utils.log_util import *
 
 
+@dataclass(frozen=True)
+class FunctionEntry:
+    """A function script found in the functions directory."""
+
+    name: str
+    mtime: float
+    size: int
+
+
 class FileHandler:
-    """Handles file operations for function order and window size."""
+    """Handles the function files and the saved order, check states and window size."""
 
     @staticmethod
     @log_entry_exit
     def update_order_file(function_rows: List[Dict]) -> None:
-        """Update the .order file with the current function order."""
-        with open(ORDER_FILE, "w") as f:
-            for row in function_rows:
-                f.write(row["filename"] + "\n")
-        LOGI("Updated order file")
+        """Save the current function order, names and check states to the state store."""
+        FileHandler.save_function_states(FileHandler.function_states(function_rows))
+
+    @staticmethod
+    def function_states(function_rows: List[Dict]) -> List[Tuple[str, str, bool]]:
+        """Return the (filename, display name, checked) rows to save; call it on the Tk thread."""
+        return [
+            (
+                row["filename"],
+                row["name_var"].get() if "name_var" in row else row["filename"],
+                bool(row["check_var"].get()) if "check_var" in row else False,
+            )
+            for row in function_rows
+        ]
+
+    @staticmethod
+    @log_entry_exit
+    def save_function_states(states: List[Tuple[str, str, bool]]) -> None:
+        """Save function_states() rows to the state store (safe off the Tk thread)."""
+        changed = get_state_store().save_functions(states)
+        LOGI(f"Updated function order ({changed} row(s) changed)")
+
+    @staticmethod
+    @log_entry_exit
+    def load_check_states() -> Dict[str, bool]:
+        """Return the saved check state of every function by file name."""
+        return {
+            filename: checked
+            for filename, (_, _, checked) in get_state_store().functions().items()
+        }
 
     @staticmethod
     @log_entry_exit
     def load_window_size() -> tuple[int, int]:
-        """Load window size from file or return default."""
-        try:
-            with open(WINDOW_SIZE_FILE, "r") as f:
-                size_data = json.load(f)
-                return size_data.get(
-                    "width", DEFAULT_WINDOW_SIZE["width"]
-                ), size_data.get("height", DEFAULT_WINDOW_SIZE["height"])
-        except FileNotFoundError:
-            return DEFAULT_WINDOW_SIZE["width"], DEFAULT_WINDOW_SIZE["height"]
+        """Load window size from the state store or return default."""
+        size_data = get_state_store().get_setting("window_size", {})
+        return size_data.get("width", DEFAULT_WINDOW_SIZE["width"]), size_data.get(
+            "height", DEFAULT_WINDOW_SIZE["height"]
+        )
 
     @staticmethod
     @log_entry_exit
     def save_window_size(width: int, height: int) -> None:
-        """Save window size to file."""
-        size_data = {"width": width, "height": height}
-        with open(WINDOW_SIZE_FILE, "w") as f:
-            json.dump(size_data, f)
+        """Save window size to the state store."""
+        get_state_store().set_setting("window_size", {"width": width, "height": height})
         LOGI("Saved window size")
 
     @staticmethod
     @log_entry_exit
     def load_function_files() -> List[str]:
         """Load and order function files from the functions directory."""
-        if not os.path.exists(FUNCTIONS_DIR):
-            os.makedirs(FUNCTIONS_DIR)
-        all_files = [f for f in os.listdir(FUNCTIONS_DIR) if f.endswith(".py")]
-        ordered_files = []
-        if os.path.exists(ORDER_FILE):
-            with open(ORDER_FILE, "r") as f:
-                ordered_files = [line.strip() for line in f if line.strip()]
-            ordered_files = [f for f in ordered_files if f in all_files]
-            for f in all_files:
-                if f not in ordered_files:
-                    ordered_files.append(f)
-        else:
-            ordered_files = sorted(all_files)
-        return ordered_files
+        return [entry.name for entry in FileHandler.scan_function_files()]
+
+    @staticmethod
+    @log_entry_exit
+    def scan_function_files(
+        functions_dir: str = FUNCTIONS_DIR, saved_order: Optional[List[str]] = None
+    ) -> List[FunctionEntry]:
+        """Return the function scripts in the saved order, followed by new scripts by name.
+
+        One scandir pass and dict/set lookups keep this linear in the number
+        of scripts. saved_order defaults to the order in the state store.
+        """
+        if not os.path.exists(functions_dir):
+            os.makedirs(functions_dir)
+        entries: Dict[str, FunctionEntry] = {}
+        with os.scandir(functions_dir) as it:
+            for item in it:
+                if item.name.endswith(".py") and item.is_file():
+                    stat = item.stat()
+                    entries[item.name] = FunctionEntry(item.name, stat.st_mtime, stat.st_size)
+        if saved_order is None:
+            saved_order = get_state_store().function_order()
+        ordered = [entries[name] for name in saved_order if name in entries]
+        known = set(saved_order)
+        ordered.extend(entries[name] for name in sorted(entries) if name not in known)
+        return ordered
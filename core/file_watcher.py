@@ -0,0 +1,240 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from cfg.constants import FUNCTIONS_DIR, WATCH_DEBOUNCE, WATCH_POLL_INTERVAL
+from utils.log_util import *
+
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+# inotify event masks (linux/inotify.h)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Signature of a script: (mtime ns, size)
+Signature = Tuple[int, int]
+
+
+class _Inotify:
+    """Minimal inotify binding over libc (Linux only)."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """Wait up to timeout for events; return the changed names, or None if a rescan is needed."""
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = os.fsdecode(data[pos : pos + length].rstrip(b"\0"))
+            pos += length
+            if mask & (_IN_Q_OVERFLOW | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                return None
+            if name:
+                names.add(name)
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FunctionWatcher:
+    """Background watcher of the function scripts.
+
+    Uses inotify where available and falls back to polling the directory
+    every WATCH_POLL_INTERVAL seconds. Changes are debounced: once no new
+    change came in for WATCH_DEBOUNCE seconds, callback gets the list of
+    (ADDED | REMOVED | MODIFIED, filename) events of the .py scripts.
+    callback runs on the watcher thread.
+    """
+
+    @log_entry_exit
+    def __init__(
+        self,
+        callback: Callable[[List[Tuple[str, str]]], None],
+        functions_dir: str = FUNCTIONS_DIR,
+        debounce: float = WATCH_DEBOUNCE,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        use_inotify: bool = True,
+    ):
+        self.callback = callback
+        self.functions_dir = functions_dir
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.backend: Optional[str] = None
+        self._snapshot: Dict[str, Signature] = {}
+        self._last_poll: Dict[str, Signature] = {}
+        self._inotify: Optional[_Inotify] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @log_entry_exit
+    def start(self) -> None:
+        """Take the initial snapshot and start the watcher thread."""
+        self._snapshot = self._scan()
+        self._last_poll = dict(self._snapshot)
+        if self.use_inotify:
+            try:
+                self._inotify = _Inotify(self.functions_dir)
+            except (OSError, AttributeError) as e:
+                LOGD(f"inotify unavailable, polling instead: {e}")
+        self.backend = "inotify" if self._inotify is not None else "polling"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="function_watcher", daemon=True)
+        self._thread.start()
+        LOGI(f"Watching {self.functions_dir} ({self.backend})")
+
+    @log_entry_exit
+    def stop(self) -> None:
+        """Stop the watcher thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _scan(self) -> Dict[str, Signature]:
+        """Return the signature of every script in the directory."""
+        snapshot = {}
+        try:
+            with os.scandir(self.functions_dir) as it:
+                for item in it:
+                    if item.name.endswith(".py") and item.is_file():
+                        stat = item.stat()
+                        snapshot[item.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return snapshot
+
+    def _signature(self, name: str) -> Optional[Signature]:
+        """Return the signature of one script, or None if it is gone."""
+        try:
+            stat = os.stat(os.path.join(self.functions_dir, name))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _wait(self, timeout: float) -> Optional[Set[str]]:
+        """Wait for changes; return the changed names, or None if a rescan is needed."""
+        if self._inotify is not None:
+            return self._inotify.read(timeout)
+        if self._stop.wait(timeout):
+            return set()
+        # Names that changed since the previous poll, so settled changes stop extending the debounce
+        current = self._scan()
+        changed = {
+            name
+            for name in current.keys() | self._last_poll.keys()
+            if current.get(name) != self._last_poll.get(name)
+        }
+        self._last_poll = current
+        return changed
+
+    def _run(self) -> None:
+        """Collect changed names and report them once they settle."""
+        pending: Set[str] = set()
+        rescan = False
+        deadline = None
+        while not self._stop.is_set():
+            if self._inotify is None:
+                timeout = self.poll_interval
+            else:
+                timeout = 0.5 if deadline is None else deadline - time.monotonic()
+            try:
+                names = self._wait(timeout)
+            except OSError as e:
+                LOGE(f"Function watcher failed: {e}")
+                return
+            if names is None:
+                rescan = True
+                deadline = time.monotonic() + self.debounce
+            else:
+                names = {name for name in names if name.endswith(".py")}
+                if names:
+                    pending.update(names)
+                    deadline = time.monotonic() + self.debounce
+            if deadline is not None and time.monotonic() >= deadline:
+                changes = self._rescan() if rescan else self._changes(pending)
+                pending.clear()
+                rescan = False
+                deadline = None
+                if changes:
+                    LOGD(f"Function files changed: {changes}")
+                    try:
+                        self.callback(changes)
+                    except Exception as e:
+                        LOGE(f"Function watcher callback failed: {e!r}")
+
+    def _changes(self, names: Set[str]) -> List[Tuple[str, str]]:
+        """Compare the changed names with the snapshot and update it."""
+        changes = []
+        for name in sorted(names):
+            old = self._snapshot.get(name)
+            new = self._signature(name)
+            if old == new:
+                continue
+            if new is None:
+                del self._snapshot[name]
+                changes.append((REMOVED, name))
+            else:
+                self._snapshot[name] = new
+                changes.append((ADDED if old is None else MODIFIED, name))
+        return changes
+
+    def _rescan(self) -> List[Tuple[str, str]]:
+        """Diff a full directory scan against the snapshot (after an inotify overflow)."""
+        current = self._scan()
+        changed = {
+            name
+            for name in current.keys() | self._snapshot.keys()
+            if current.get(name) != self._snapshot.get(name)
+        }
+        return self._changes(changed)
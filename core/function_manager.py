@@ -1,8 +1,16 @@
-import importlib.util
 import os
-from typing import List, Dict, TYPE_CHECKING
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, List, Dict, Optional, TYPE_CHECKING
 from tkinter import messagebox
-from cfg.constants import FUNCTIONS_DIR
+from cfg.constants import FUNCTIONS_DIR, WATCH_UI_INTERVAL_MS
+from core.bytecode_cache import BytecodeCompiler
+from core.file_watcher import ADDED, MODIFIED, REMOVED, FunctionWatcher
+from core.metadata_index import MetadataIndex
+from core.rename_planner import apply_renames, recover_renames
+from core.runner import FunctionRunner, RunResult
+from core.scheduler import DependencyError
 from utils.log_util import *
 
 
@@ -18,50 +26,181 @@ class FunctionManager:
     def __init__(self, app: "FunctionRunnerApp"):  # Use a forward reference
         self.app = app
         self.function_rows: List[Dict] = []
+        self.runner = FunctionRunner(
+            mode=getattr(app, "run_mode", None),
+            max_workers=getattr(app, "max_workers", None),
+            async_limit=getattr(app, "async_limit", None),
+            use_result_cache=getattr(app, "use_result_cache", False),
+            timeout=getattr(app, "timeout", None),
+        )
+        self.last_results: List[RunResult] = []
+        self._run_thread: Optional[threading.Thread] = None
+        self.metadata = MetadataIndex()
+        self.compiler = BytecodeCompiler(self.runner.functions_dir)
+        self.watcher: Optional[FunctionWatcher] = None
+        self._file_changes: "queue.Queue" = queue.Queue()
 
     @log_entry_exit
     def load_functions(self) -> None:
         """Load functions from files and populate rows."""
         from core.file_handler import FileHandler
 
-        ordered_files = FileHandler.load_function_files()
+        recover_renames()
+        entries = FileHandler.scan_function_files()
+        self.metadata.update(entries)
+        # First runs then skip parsing and compiling
+        self.compiler.schedule()
+        ordered_files = [entry.name for entry in entries]
+        check_states = FileHandler.load_check_states()
         self.function_rows = []
         for idx, filename in enumerate(ordered_files, start=1):
             self.add_function_row(idx, filename)
-        from core.file_handler import FileHandler
+            self.function_rows[-1]["check_var"].set(check_states.get(filename, False))
 
-        FileHandler.update_order_file(self.function_rows)
+        self.app.mark_dirty("functions")
         self.app.ui.reload_order()
 
+    @log_entry_exit
+    def start_watching(self) -> None:
+        """Watch the functions directory and apply changes to the rows as they happen."""
+        self.watcher = FunctionWatcher(self._file_changes.put)
+        self.watcher.start()
+        self.app.root.after(WATCH_UI_INTERVAL_MS, self._poll_file_changes)
+
+    @log_entry_exit
+    def stop_watching(self) -> None:
+        """Stop the functions directory watcher."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.compiler.stop()
+
+    def _poll_file_changes(self) -> None:
+        """Apply the changes reported by the watcher thread, on the Tk thread."""
+        if self.watcher is None:
+            return
+        while True:
+            try:
+                changes = self._file_changes.get_nowait()
+            except queue.Empty:
+                break
+            self.apply_file_changes(changes)
+        self.app.root.after(WATCH_UI_INTERVAL_MS, self._poll_file_changes)
+
+    @log_entry_exit
+    def apply_file_changes(self, changes: List[tuple]) -> None:
+        """Add, remove or refresh only the rows of the changed function files."""
+        self.metadata.refresh([filename for _, filename in changes])
+        # Writing the whole index is left to the autosaver, off the Tk thread
+        self.app.mark_dirty("metadata")
+        self.compiler.schedule([filename for kind, filename in changes if kind != REMOVED])
+        rows_by_name = {row["filename"]: row for row in self.function_rows}
+        first_moved = None
+        added = 0
+        for kind, filename in changes:
+            row = rows_by_name.get(filename)
+            if kind == ADDED and row is None:
+                self.add_function_row(len(self.function_rows) + 1, filename)
+                rows_by_name[filename] = self.function_rows[-1]
+                self.function_rows[-1]["entry"].config(
+                    state="normal" if self.app.edit_mode else "readonly"
+                )
+                if not self.app.ui.row_visible(self.function_rows[-1]):
+                    self.function_rows[-1]["frame"].pack_forget()
+                added += 1
+                LOGI(f"Function added: {filename}")
+            elif kind == REMOVED and row is not None:
+                idx = self.function_rows.index(row)
+                row["frame"].destroy()
+                del self.function_rows[idx]
+                del rows_by_name[filename]
+                first_moved = idx if first_moved is None else min(first_moved, idx)
+                if self.app.selected_row is not None and self.app.selected_row >= idx:
+                    self.app.selected_row = (
+                        None if self.app.selected_row == idx else self.app.selected_row - 1
+                    )
+                LOGI(f"Function removed: {filename}")
+            elif kind in (MODIFIED, REMOVED):
+                LOGI(f"Function {kind}: {filename}")
+            if kind == MODIFIED and row is not None:
+                row["tooltip"].text = self.describe(filename)
+            if kind in (MODIFIED, REMOVED):
+                self.runner.module_cache.invalidate(os.path.join(FUNCTIONS_DIR, filename))
+        if first_moved is not None:
+            self.app.ui.renumber_rows(first_moved)
+        if added or first_moved is not None:
+            self.app.ui.update_scrollregion()
+            self.app.mark_dirty("functions")
+
     @log_entry_exit
     def add_function_row(self, idx: int, filename: str) -> None:
         """Add a new function row to the UI."""
         row = self.app.ui.create_function_row(
             idx, filename, self.run_function, self.app.select_row
         )
+        row["tooltip"].text = self.describe(filename)
+        row["check_var"].trace_add("write", lambda *args: self.app.mark_dirty("functions"))
         self.function_rows.append(row)
 
+    def describe(self, filename: str) -> str:
+        """Return the metadata summary of a function for its row tooltip."""
+        metadata = self.metadata.get(filename)
+        return metadata.summary() if metadata is not None else ""
+
+    def visible_functions(self, query: str) -> List[str]:
+        """Return the file names of the rows matching a metadata filter query."""
+        return self.metadata.filter([row["filename"] for row in self.function_rows], query)
+
     @log_entry_exit
     def run_function(self, filename: str) -> None:
-        """Run a function from a specified file."""
-        filepath = os.path.join(FUNCTIONS_DIR, filename)
-        spec = importlib.util.spec_from_file_location("module.name", filepath)
-        module = importlib.util.module_from_spec(spec)
-        try:
-            spec.loader.exec_module(module)
-            if hasattr(module, "main"):
-                module.main()
-            else:
-                LOGW(f"{filename} has no main() function.")
-        except Exception as e:
-            LOGF(f"Failed to run {filename}: {e}")
+        """Run a function from a specified file in the background."""
+        self._start_run(self._run_in_background, filename, "run_function")
 
     @log_entry_exit
     def run_all(self) -> None:
-        """Run all checked functions."""
-        for row in self.function_rows:
-            if row["check_var"].get():
-                self.run_function(row["name_var"].get())
+        """Run all checked functions in the background."""
+        filenames = [
+            row["name_var"].get() for row in self.function_rows if row["check_var"].get()
+        ]
+        self._start_run(self._run_all_in_background, filenames, "run_all")
+
+    def _start_run(self, target: Callable, arg: Any, name: str) -> None:
+        """Start a run on a background thread, unless one is already in progress."""
+        if self._run_thread is not None and self._run_thread.is_alive():
+            LOGW("A run is already in progress")
+            return
+        # Keep the Tk thread responsive while the functions run
+        self._run_thread = threading.Thread(
+            target=target, args=(arg,), name=name, daemon=True
+        )
+        self._run_thread.start()
+
+    @log_entry_exit
+    def _run_in_background(self, filename: str) -> None:
+        """Run one function and log its outcome."""
+        result = self.runner.run(filename)
+        status = "OK" if result.ok else f"FAILED ({result.error})"
+        LOGI(f"{result.filename}: {status} in {result.duration:.3f}s")
+
+    @log_entry_exit
+    def _run_all_in_background(self, filenames: List[str]) -> None:
+        """Run a batch of functions and log the per-function outcomes."""
+        try:
+            self.last_results = self.runner.run_many(filenames)
+        except DependencyError as e:
+            LOGE(str(e))
+            return
+        for result in self.last_results:
+            status = "OK" if result.ok else f"FAILED ({result.error})"
+            LOGI(f"{result.filename}: {status} in {result.duration:.3f}s")
+
+    @log_entry_exit
+    def cancel_run(self) -> None:
+        """Cancel the run (single function or Run All) in progress."""
+        if self._run_thread is None or not self._run_thread.is_alive():
+            LOGI("No run in progress to cancel")
+            return
+        self.runner.cancel()
 
     @log_entry_exit
     def toggle_all(self) -> None:
@@ -212,18 +351,31 @@ class FunctionManager:
     @log_entry_exit
     def save_order_and_names(self) -> None:
         """Save function order and rename files as needed."""
-        from core.file_handler import FileHandler
-
+        # Only rows whose name was edited are renamed
+        changed = {}
         for row in self.function_rows:
             new_name = row["name_var"].get().replace(" ", "_")
             if not new_name.endswith(".py"):
                 new_name += ".py"
-            old_name = row["filename"]
-            old_path = os.path.join(FUNCTIONS_DIR, old_name)
-            new_path = os.path.join(FUNCTIONS_DIR, new_name)
-            if old_name != new_name:
-                os.rename(old_path, new_path)
-                LOGI(f"Renamed {old_name} → {new_name}")
-                row["filename"] = new_name
-        FileHandler.update_order_file(self.function_rows)
+            if new_name != row["filename"]:
+                changed[row["filename"]] = (row, new_name)
+        if changed:
+            # A pending snapshot still has the old names; it must not be
+            # written over the store after the renames moved the rows
+            self.app.save_state()
+            try:
+                apply_renames({old: new for old, (_, new) in changed.items()})
+            except (OSError, ValueError, sqlite3.Error) as e:
+                LOGE(f"Functions not renamed: {e}")
+                # Edit mode is left, so show the names the files still have
+                for old_name, (row, _) in changed.items():
+                    row["name_var"].set(old_name)
+                messagebox.showerror("Rename failed", str(e))
+            else:
+                for old_name, (row, new_name) in changed.items():
+                    LOGI(f"Renamed {old_name} → {new_name}")
+                    row["filename"] = new_name
+                    row["name_var"].set(new_name)
+        self.app.mark_dirty("functions")
+        self.app.save_state()
         LOGI("Functions saved:", [row["filename"] for row in self.function_rows])
@@ -0,0 +1,242 @@
+import json
+import signal
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from core.account_source import account_id, iter_accounts
+from core.file_handler import FileHandler
+from core.rename_planner import recover_renames
+from core.runner import FunctionRunner, RunResult
+from core.scheduler import DependencyError, build_graph, topological_order
+from utils.log_util import *
+
+
+# Exit codes of the headless "run" command
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+
+@log_entry_exit
+def select_functions(names: Optional[List[str]]) -> List[str]:
+    """Resolve requested names to function files, keeping the .order ordering.
+
+    Names may be given with or without the ".py" suffix; no names selects all.
+    Raises ValueError listing any name that does not match a function file.
+    """
+    recover_renames()
+    ordered_files = FileHandler.load_function_files()
+    if not names:
+        return ordered_files
+    wanted = {name if name.endswith(".py") else name + ".py" for name in names}
+    unknown = wanted.difference(ordered_files)
+    if unknown:
+        raise ValueError(f"Unknown function(s): {', '.join(sorted(unknown))}")
+    return [f for f in ordered_files if f in wanted]
+
+
+def build_summary(results: List[RunResult], mode: str, duration: float) -> Dict:
+    """Build the machine-readable summary of a headless batch."""
+    failed = sum(not r.ok for r in results)
+    return {
+        "status": "failed" if failed else "ok",
+        "mode": mode,
+        "total": len(results),
+        "ok": len(results) - failed,
+        "failed": failed,
+        "duration": round(duration, 6),
+        "results": [
+            {
+                "function": r.filename,
+                "ok": r.ok,
+                "error": r.error,
+                "duration": round(r.duration, 6),
+                "cached": r.cached,
+                "result": r.result,
+            }
+            for r in results
+        ],
+    }
+
+
+@log_entry_exit
+def run_accounts(
+    runner: FunctionRunner,
+    filenames: List[str],
+    accounts_path: str,
+    chunk_size: Optional[int] = None,
+) -> Dict:
+    """Run each function over every account of the file, keeping only failures.
+
+    Functions run one after another, dependencies first. Like in a batch,
+    a function is skipped for the accounts one of its dependencies failed
+    for.
+    """
+    start = time.perf_counter()
+    functions = []
+    graph = build_graph(runner.functions_dir, filenames)
+    # Ids of the accounts each function failed for (or was skipped for)
+    failed_ids: Dict[str, set] = {}
+    for filename in topological_order(graph):
+        total = 0
+        failures = []
+        # The first failed dependency of each account to skip
+        skip: Dict[str, str] = {}
+        for dep in graph[filename]:
+            for acc_id in failed_ids[dep]:
+                skip.setdefault(acc_id, dep)
+        skipped: List[Dict] = []
+        accounts = _skip_accounts(filename, iter_accounts(accounts_path), skip, skipped)
+        for results in runner.run_for_accounts(filename, accounts, chunk_size):
+            total += len(results)
+            failures.extend(
+                {"account": r.account, "error": r.error} for r in results if not r.ok
+            )
+        total += len(skipped)
+        failures.extend(skipped)
+        failed_ids[filename] = {f["account"] for f in failures if f["account"] is not None}
+        functions.append(
+            {
+                "function": filename,
+                "accounts": total,
+                "ok": total - len(failures),
+                "failed": len(failures),
+                "failures": failures,
+            }
+        )
+    failed = sum(f["failed"] for f in functions)
+    return {
+        "status": "failed" if failed else "ok",
+        "mode": runner.mode,
+        "accounts_file": accounts_path,
+        "total": sum(f["accounts"] for f in functions),
+        "ok": sum(f["ok"] for f in functions),
+        "failed": failed,
+        "duration": round(time.perf_counter() - start, 6),
+        "functions": functions,
+    }
+
+
+def _skip_accounts(
+    filename: str, accounts: Iterator[Dict], skip: Dict[str, str], skipped: List[Dict]
+) -> Iterator[Dict]:
+    """Yield the accounts to run; those in skip (id -> failed dependency) go to skipped."""
+    for account in accounts:
+        acc_id = account_id(account)
+        dep = skip.get(acc_id)
+        if dep is None:
+            yield account
+            continue
+        LOGW(
+            f"Skipping {filename} for {acc_id}: dependency {dep} failed",
+            account=acc_id,
+            function=filename,
+        )
+        skipped.append({"account": acc_id, "error": f"dependency {dep} failed"})
+
+
+@log_entry_exit
+def run_batch(
+    names: Optional[List[str]],
+    mode: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    async_limit: Optional[int] = None,
+    summary_path: str = "-",
+    accounts_path: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    use_result_cache: bool = False,
+    invalidate: bool = False,
+    timeout: Optional[float] = None,
+    queue_size: Optional[int] = None,
+) -> int:
+    """Run functions without the GUI, write a JSON summary and return an exit code.
+
+    With accounts_path, every function runs as main(account) for each row of
+    the account file instead of once. Ctrl+C cancels the batch: the summary
+    of what ran is still written and EXIT_CANCELLED is returned.
+    """
+    try:
+        filenames = select_functions(names)
+        runner = FunctionRunner(
+            mode=mode,
+            max_workers=max_workers,
+            async_limit=async_limit,
+            use_result_cache=use_result_cache,
+            timeout=timeout,
+            queue_size=queue_size,
+        )
+    except ValueError as e:
+        LOGE(str(e))
+        return EXIT_USAGE
+
+    previous_handler = _install_cancel_handler(runner)
+    try:
+        if invalidate:
+            for filename in filenames:
+                runner.invalidate_results(filename)
+        exit_code = _run_and_report(
+            runner, filenames, summary_path, accounts_path, chunk_size
+        )
+        return EXIT_CANCELLED if runner.cancel_event.is_set() else exit_code
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+        runner.close()
+
+
+def _install_cancel_handler(runner: FunctionRunner):
+    """Make SIGINT cancel the runner; return the previous handler to restore."""
+    if threading.current_thread() is not threading.main_thread():
+        return None
+
+    def on_sigint(signum, frame):
+        if runner.cancel_event.is_set():
+            # A second Ctrl+C aborts right away
+            raise KeyboardInterrupt
+        runner.cancel()
+
+    return signal.signal(signal.SIGINT, on_sigint)
+
+
+def _run_and_report(
+    runner: FunctionRunner,
+    filenames: List[str],
+    summary_path: str,
+    accounts_path: Optional[str],
+    chunk_size: Optional[int],
+) -> int:
+    """Run the batch, write its summary and return the exit code."""
+    if accounts_path:
+        try:
+            summary = run_accounts(runner, filenames, accounts_path, chunk_size)
+        except DependencyError as e:
+            LOGE(str(e))
+            return EXIT_USAGE
+        except (OSError, ImportError) as e:
+            LOGE(f"Cannot read accounts from {accounts_path}: {e}")
+            return EXIT_USAGE
+    else:
+        start = time.perf_counter()
+        try:
+            results = runner.run_many(filenames)
+        except DependencyError as e:
+            LOGE(str(e))
+            return EXIT_USAGE
+        summary = build_summary(results, runner.mode, time.perf_counter() - start)
+
+    if runner.cancel_event.is_set():
+        summary["status"] = "cancelled"
+    # Results of arbitrary scripts are not always JSON serializable
+    text = json.dumps(summary, default=repr)
+    if summary_path == "-":
+        # Buffered console logs go out first so they do not split the summary
+        flush_logs()
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+    else:
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        LOGI(f"Wrote run summary to {summary_path}")
+    return EXIT_FAILED if summary["failed"] else EXIT_OK
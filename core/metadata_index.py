@@ -0,0 +1,225 @@
+import ast
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+from cfg.constants import FUNCTIONS_DIR, METADATA_INDEX_FILE, METADATA_PARALLEL_MIN
+from core.scheduler import literal_from_tree
+from utils.log_util import *
+
+
+@dataclass
+class FunctionMetadata:
+    """What a function script declares, read with ast without running it."""
+
+    filename: str
+    mtime: float = 0.0
+    size: int = 0
+    docstring: str = ""
+    has_main: bool = False
+    is_async: bool = False
+    tags: List[str] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def summary(self) -> str:
+        """Return a short multi-line description for tooltips."""
+        if self.error:
+            return f"Cannot parse: {self.error}"
+        if not self.has_main:
+            kind = "no main()"
+        else:
+            kind = "async main()" if self.is_async else "main()"
+        lines = [self.docstring.strip().splitlines()[0]] if self.docstring.strip() else []
+        lines.append(kind)
+        if self.tags:
+            lines.append("tags: " + ", ".join(self.tags))
+        if self.imports:
+            lines.append("imports: " + ", ".join(self.imports))
+        return "\n".join(lines)
+
+    def matches(self, query: str) -> bool:
+        """Return True if every word of query matches.
+
+        A word matches a substring of the file name, docstring, tags or
+        imports; "tag:x" and "import:x" match one field, and "async",
+        "sync" and "nomain" match the kind of main().
+        """
+        text = " ".join([self.filename, self.docstring] + self.tags + self.imports).lower()
+        for word in query.lower().split():
+            if word.startswith("tag:"):
+                ok = word[4:] in (tag.lower() for tag in self.tags)
+            elif word.startswith("import:"):
+                ok = word[7:] in (name.lower() for name in self.imports)
+            elif word == "async":
+                ok = self.has_main and self.is_async
+            elif word == "sync":
+                ok = self.has_main and not self.is_async
+            elif word == "nomain":
+                ok = not self.has_main
+            else:
+                ok = word in text
+            if not ok:
+                return False
+        return True
+
+
+def parse_metadata(filepath: str) -> FunctionMetadata:
+    """Parse one script with ast and return its metadata; errors are recorded, not raised."""
+    stat = os.stat(filepath)
+    metadata = FunctionMetadata(os.path.basename(filepath), stat.st_mtime, stat.st_size)
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=filepath)
+    except (OSError, SyntaxError, ValueError) as e:
+        metadata.error = str(e)
+        return metadata
+    metadata.docstring = ast.get_docstring(tree) or ""
+    imports = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == "main":
+            # Like at runtime, the last definition wins
+            metadata.has_main = True
+            metadata.is_async = isinstance(node, ast.AsyncFunctionDef)
+        elif isinstance(node, ast.Import):
+            imports.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            imports.add(node.module.split(".")[0])
+    metadata.imports = sorted(imports)
+    tags = literal_from_tree(tree, "TAGS", [], filepath)
+    if isinstance(tags, str):
+        tags = [tags]
+    metadata.tags = [str(tag) for tag in tags] if isinstance(tags, (list, tuple)) else []
+    return metadata
+
+
+class MetadataIndex:
+    """On-disk index of function metadata, keyed by file mtime and size.
+
+    update() parses only new and changed scripts, on a process pool when
+    there are at least METADATA_PARALLEL_MIN of them, and drops removed
+    ones, so a warm start only loads the JSON index.
+    """
+
+    @log_entry_exit
+    def __init__(self, path: str = METADATA_INDEX_FILE, functions_dir: str = FUNCTIONS_DIR):
+        self.path = path
+        self.functions_dir = functions_dir
+        self._entries: Dict[str, FunctionMetadata] = {}
+        self._lock = threading.Lock()
+        # Saves may come from the autosave thread while the UI thread updates
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        """Load the saved index, if any."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = {item["filename"]: FunctionMetadata(**item) for item in data}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            LOGW(f"Ignoring unreadable metadata index {self.path}: {e}")
+            return
+        with self._lock:
+            self._entries = entries
+
+    def save(self) -> None:
+        """Write the index (atomic replace)."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._save_lock:
+            with self._lock:
+                data = [asdict(metadata) for metadata in self._entries.values()]
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, filename: str) -> Optional[FunctionMetadata]:
+        """Return the metadata of a script, or None if it is not indexed."""
+        with self._lock:
+            return self._entries.get(filename)
+
+    def filter(self, filenames: List[str], query: str) -> List[str]:
+        """Return the file names whose metadata matches query, in the given order."""
+        if not query.strip():
+            return list(filenames)
+        with self._lock:
+            entries = self._entries
+        return [
+            name
+            for name in filenames
+            if (entries.get(name) or FunctionMetadata(name)).matches(query)
+        ]
+
+    @log_entry_exit
+    def update(self, entries: Optional[List] = None) -> int:
+        """Re-parse new and changed scripts, drop removed ones and save; return the parse count.
+
+        entries are the FunctionEntry records of the current scripts
+        (FileHandler.scan_function_files() by default).
+        """
+        if entries is None:
+            from core.file_handler import FileHandler
+
+            entries = FileHandler.scan_function_files(self.functions_dir, [])
+        with self._lock:
+            current = {entry.name for entry in entries}
+            removed = [name for name in self._entries if name not in current]
+            for name in removed:
+                del self._entries[name]
+            stale = []
+            for entry in entries:
+                cached = self._entries.get(entry.name)
+                if cached is None or (cached.mtime, cached.size) != (entry.mtime, entry.size):
+                    stale.append(entry.name)
+        if not stale and not removed:
+            return 0
+        paths = [os.path.join(self.functions_dir, name) for name in stale]
+        results = self._parse_all(paths)
+        with self._lock:
+            for metadata in results:
+                if metadata is not None:
+                    self._entries[metadata.filename] = metadata
+        self.save()
+        LOGI(f"Metadata index: parsed {len(stale)}, removed {len(removed)} script(s)")
+        return len(stale)
+
+    def _parse_all(self, paths: List[str]) -> List[Optional[FunctionMetadata]]:
+        """Parse scripts, in parallel processes when there are many."""
+        if len(paths) < METADATA_PARALLEL_MIN:
+            return [_parse_if_exists(path) for path in paths]
+        workers = min(os.cpu_count() or 1, 8)
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            return list(pool.map(_parse_if_exists, paths, chunksize=chunksize))
+
+    @log_entry_exit
+    def refresh(self, filenames: List[str]) -> None:
+        """Re-parse some scripts (e.g. after the watcher saw them change).
+
+        The index is not saved; the caller saves it, e.g. through the autosaver.
+        """
+        for filename in filenames:
+            metadata = _parse_if_exists(os.path.join(self.functions_dir, filename))
+            with self._lock:
+                if metadata is None:
+                    self._entries.pop(filename, None)
+                else:
+                    self._entries[filename] = metadata
+
+
+def _parse_if_exists(filepath: str) -> Optional[FunctionMetadata]:
+    """parse_metadata(), or None if the script was removed meanwhile."""
+    try:
+        return parse_metadata(filepath)
+    except FileNotFoundError:
+        return None
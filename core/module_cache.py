@@ -0,0 +1,127 @@
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from types import ModuleType
+from typing import Dict, Optional, Tuple
+from cfg.constants import MODULE_CACHE_SIZE
+from core.bytecode_cache import FunctionBundle
+from core.rate_limiter import get_rate_limiter
+from utils.log_util import *
+
+
+class ModuleCache:
+    """LRU cache of loaded function modules, invalidated when the file changes.
+
+    Modules are compiled from the function bundle when it holds the current
+    version of a script, else loaded from source and __pycache__. Scripts
+    are executed outside the cache lock, so a slow or hanging import only
+    holds up the callers loading that same script.
+    """
+
+    @log_entry_exit
+    def __init__(self, max_size: int = MODULE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._modules: "OrderedDict[str, Tuple[Tuple[int, int], ModuleType]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        # Loads in progress: path -> (signature, future of the module)
+        self._loading: Dict[str, Tuple[Tuple[int, int], Future]] = {}
+        self.bundle = FunctionBundle()
+
+    @staticmethod
+    def _signature(filepath: str) -> Tuple[int, int]:
+        """Return the (mtime, size) pair used to detect file changes."""
+        stat = os.stat(filepath)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _exec_module(self, filepath: str, signature: Tuple[int, int]) -> ModuleType:
+        """Read, compile and execute a function script as a fresh module."""
+        module_name = "functions." + os.path.splitext(os.path.basename(filepath))[0]
+        spec = importlib.util.spec_from_file_location(module_name, filepath)
+        module = importlib.util.module_from_spec(spec)
+        # Scripts pace their API calls with the shared limiter
+        module.rate_limiter = get_rate_limiter()
+        code = self.bundle.code_for(filepath, signature)
+        if code is not None:
+            exec(code, module.__dict__)
+        else:
+            spec.loader.exec_module(module)
+        return module
+
+    def load(self, filepath: str) -> ModuleType:
+        """Return the module for filepath, reloading it if the file changed."""
+        key = os.path.abspath(filepath)
+        signature = self._signature(filepath)
+        with self._lock:
+            cached = self._modules.get(key)
+            if cached is not None and cached[0] == signature:
+                self._modules.move_to_end(key)
+                self.hits += 1
+                LOGV(Lazy("Module cache hit: %s", filepath))
+                return cached[1]
+            loading = self._loading.get(key)
+            if loading is not None and loading[0] == signature:
+                # Another thread is executing this version: wait for its module
+                future = loading[1]
+                owner = False
+            else:
+                future = Future()
+                self._loading[key] = (signature, future)
+                owner = True
+                self.misses += 1
+                LOGD(f"Module cache {'stale' if cached else 'miss'}: {filepath}")
+        if not owner:
+            return future.result()
+
+        try:
+            module = self._exec_module(filepath, signature)
+        except BaseException as e:
+            with self._lock:
+                self._done_loading(key, future)
+            future.set_exception(e)
+            raise
+        try:
+            current = self._signature(filepath)
+        except OSError:
+            current = None
+        with self._lock:
+            self._done_loading(key, future)
+            cached = self._modules.get(key)
+            # Keep a newer version another thread loaded while this one ran
+            if cached is None or cached[0] != current or current == signature:
+                self._modules[key] = (signature, module)
+                self._modules.move_to_end(key)
+                while len(self._modules) > self.max_size:
+                    evicted, _ = self._modules.popitem(last=False)
+                    LOGD(f"Module cache evicted: {evicted}")
+        future.set_result(module)
+        return module
+
+    def _done_loading(self, key: str, future: Future) -> None:
+        """Forget a finished load, unless a newer one replaced it; the caller holds the lock."""
+        loading = self._loading.get(key)
+        if loading is not None and loading[1] is future:
+            del self._loading[key]
+
+    def invalidate(self, filepath: Optional[str] = None) -> None:
+        """Drop one cached module, or all of them if no path is given."""
+        with self._lock:
+            if filepath is None:
+                self._modules.clear()
+            else:
+                self._modules.pop(os.path.abspath(filepath), None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current cache size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._modules),
+            "max_size": self.max_size,
+            "bundle_hits": self.bundle.hits,
+        }
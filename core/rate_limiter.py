@@ -0,0 +1,264 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from cfg.constants import RATE_LIMITS, RATE_LIMITS_FILE, RATE_LIMIT_MAX_BUCKETS
+from core.account_source import account_id
+from utils.log_util import *
+
+
+# Keys of the buckets shared by all accounts of an operation, and of calls
+# made without an account
+_ALL_ACCOUNTS = "*"
+_NO_ACCOUNT = "-"
+
+# Settings of one operation in the rate limit file (numbers >= 0, 0: no limit)
+_LIMIT_KEYS = ("rate", "burst", "global_rate", "global_burst")
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens/s up to burst tokens.
+
+    Tokens are reserved rather than waited for: a caller may take tokens
+    the bucket does not have yet and is told how long to wait, so callers
+    are served in arrival order.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        if rate <= 0:
+            raise ValueError(f"Rate limit must be positive, got {rate}")
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens earned since the last update."""
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, now: float, tokens: float = 1.0) -> float:
+        """Take tokens and return the seconds to wait before using them."""
+        self._refill(now)
+        self.tokens -= tokens
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def penalize(self, now: float, seconds: float) -> None:
+        """Hold back the bucket so the next token is available in seconds."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1.0) - seconds * self.rate
+
+    def is_full(self, now: float) -> bool:
+        """Return True if the bucket is back to its burst size (same as a new one)."""
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+def load_limits(path: str = RATE_LIMITS_FILE) -> Dict[str, Dict[str, float]]:
+    """Return RATE_LIMITS updated with the per-operation limits of a JSON file.
+
+    The file maps operation names (and "default") to {"rate", "burst"} per
+    account and optional {"global_rate", "global_burst"} across accounts.
+    """
+    limits = {op: dict(limit) for op, limit in RATE_LIMITS.items()}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return limits
+    except (OSError, ValueError) as e:
+        LOGW(f"Ignoring unreadable rate limit file {path}: {e}")
+        return limits
+    if not isinstance(data, dict):
+        LOGW(f"Ignoring rate limit file {path}: expected an object of operations")
+        return limits
+    loaded = 0
+    for operation, limit in data.items():
+        if not isinstance(limit, dict):
+            LOGW(f"Ignoring rate limit of {operation} in {path}: expected an object")
+            continue
+        valid = {}
+        for name, value in limit.items():
+            if (
+                name not in _LIMIT_KEYS
+                or isinstance(value, bool)
+                or not isinstance(value, (int, float))
+                or value < 0
+            ):
+                LOGW(f"Ignoring rate limit {operation}.{name} = {value!r} in {path}")
+                continue
+            valid[name] = value
+        limits.setdefault(operation, {}).update(valid)
+        loaded += 1
+    LOGD(f"Loaded rate limits for {loaded} operation(s) from {path}")
+    return limits
+
+
+class RateLimiter:
+    """Token buckets per (operation, account), plus optional global ones per operation.
+
+    Function scripts get the shared limiter as the module global
+    "rate_limiter" and call rate_limiter.acquire("edit_name", account)
+    before each API request. Limits hold per process: in the process and
+    prefork modes every worker enforces them on its own. clock and sleep
+    can be replaced, e.g. by a fake clock when testing against a local
+    fake server.
+    """
+
+    @log_entry_exit
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Dict[str, float]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = time.sleep,
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+    ):
+        self.limits = limits if limits is not None else load_limits()
+        self.clock = clock
+        self.sleep = sleep
+        self.max_buckets = max_buckets
+        self.waits = 0
+        self.waited = 0.0
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _limit(self, operation: str) -> Dict[str, float]:
+        """Return the limits of an operation, falling back to "default"."""
+        return self.limits.get(operation) or self.limits.get("default", {})
+
+    def _bucket(
+        self, operation: str, key: str, rate: float, burst: float, now: float
+    ) -> TokenBucket:
+        """Return the bucket of (operation, key), creating it on first use."""
+        bucket = self._buckets.get((operation, key))
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = TokenBucket(rate, burst, now)
+            self._buckets[(operation, key)] = bucket
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        """Forget idle buckets; a full bucket behaves like a new one."""
+        idle = [key for key, bucket in self._buckets.items() if bucket.is_full(now)]
+        for key in idle:
+            del self._buckets[key]
+        LOGD(f"Rate limiter dropped {len(idle)} idle bucket(s)")
+
+    def _buckets_for(self, operation: str, account: Any, now: float):
+        """Yield the account bucket and, if configured, the global bucket of an operation.
+
+        Without a per-account rate, the account bucket only exists to hold
+        a penalty, and is dropped once the penalty has passed.
+        """
+        limit = self._limit(operation)
+        if limit.get("rate"):
+            yield self._bucket(
+                operation,
+                _account_key(account),
+                limit["rate"],
+                limit.get("burst", 1),
+                now,
+            )
+        else:
+            key = (operation, _account_key(account))
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                if bucket.is_full(now):
+                    del self._buckets[key]
+                else:
+                    yield bucket
+        if limit.get("global_rate"):
+            yield self._bucket(
+                operation,
+                _ALL_ACCOUNTS,
+                limit["global_rate"],
+                limit.get("global_burst", 1),
+                now,
+            )
+
+    def reserve(self, operation: str, account: Any = None, tokens: float = 1.0) -> float:
+        """Take tokens for one call and return how long to wait before making it."""
+        with self._lock:
+            now = self.clock()
+            delay = 0.0
+            for bucket in self._buckets_for(operation, account, now):
+                delay = max(delay, bucket.reserve(now, tokens))
+            if delay > 0:
+                self.waits += 1
+                self.waited += delay
+        return delay
+
+    def acquire(self, operation: str, account: Any = None, tokens: float = 1.0) -> float:
+        """Block until a call of operation for account is allowed; return the wait."""
+        delay = self.reserve(operation, account, tokens)
+        if delay > 0:
+            LOGV(Lazy(_wait_message, operation, account, delay))
+            self.sleep(delay)
+        return delay
+
+    async def acquire_async(
+        self, operation: str, account: Any = None, tokens: float = 1.0
+    ) -> float:
+        """Like acquire(), but waits with asyncio.sleep for async scripts."""
+        delay = self.reserve(operation, account, tokens)
+        if delay > 0:
+            LOGV(Lazy(_wait_message, operation, account, delay))
+            await asyncio.sleep(delay)
+        return delay
+
+    @log_entry_exit
+    def penalize(self, operation: str, account: Any, seconds: float) -> None:
+        """Pause an operation for an account, e.g. after a FLOOD_WAIT of seconds.
+
+        Every bucket the account's calls of the operation go through is held
+        back, the global one included.
+        """
+        LOGW(f"Rate limit {operation}/{_account_key(account)}: backing off {seconds}s")
+        with self._lock:
+            now = self.clock()
+            buckets = list(self._buckets_for(operation, account, now))
+            if not buckets:
+                # Unlimited operation: hold a penalty-only account bucket
+                buckets = [
+                    self._bucket(operation, _account_key(account), 1.0, 1, now)
+                ]
+            for bucket in buckets:
+                bucket.penalize(now, seconds)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Return the number of buckets and how often and how long callers waited."""
+        return {
+            "buckets": len(self._buckets),
+            "waits": self.waits,
+            "waited": round(self.waited, 3),
+        }
+
+
+def _account_key(account: Any) -> str:
+    """Return the bucket key of an account row, id or None."""
+    if isinstance(account, dict):
+        account = account_id(account)
+    return _NO_ACCOUNT if account is None else str(account)
+
+
+def _wait_message(operation: str, account: Any, delay: float) -> str:
+    """Log message of a call delayed by the limiter."""
+    return f"Rate limit {operation}/{_account_key(account)}: waiting {delay:.3f}s"
+
+
+_gRateLimiter: Optional[RateLimiter] = None
+_gRateLimiterLock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide limiter, created from RATE_LIMITS_FILE on first use."""
+    global _gRateLimiter
+    with _gRateLimiterLock:
+        if _gRateLimiter is None:
+            _gRateLimiter = RateLimiter()
+        return _gRateLimiter
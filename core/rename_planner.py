@@ -0,0 +1,153 @@
+import collections
+import json
+import os
+import sqlite3
+import uuid
+from typing import Dict, List, Tuple
+from cfg.constants import FUNCTIONS_DIR, RENAME_JOURNAL_FILE
+from core.state_store import get_state_store
+from utils.log_util import *
+
+
+# State store setting holding the id of the last batch applied to the store
+_LAST_BATCH_KEY = "last_rename_batch"
+
+
+def plan_renames(renames: Dict[str, str], existing: set, batch_id: str) -> List[Tuple[str, str]]:
+    """Order a batch of old -> new file renames into safe (src, dst) steps.
+
+    A rename runs only once its target is free, so chains run back to
+    front, and cycles (e.g. swapped names) go through a temporary name.
+    Raises ValueError if two files get the same name, or if a target is an
+    existing file that is not renamed away in the batch.
+
+    Args:
+        renames (Dict[str, str]): New name of each renamed file.
+        existing (set): File names currently in the directory.
+        batch_id (str): Id used in the temporary names.
+
+    Returns:
+        List[Tuple[str, str]]: Renames in the order to apply them.
+    """
+    pending = {old: new for old, new in renames.items() if old != new}
+    targets = collections.Counter(pending.values())
+    clashes = sorted(name for name, count in targets.items() if count > 1)
+    if clashes:
+        raise ValueError(f"Several functions renamed to: {', '.join(clashes)}")
+    taken = sorted(new for new in pending.values() if new in existing and new not in pending)
+    if taken:
+        raise ValueError(f"Function file(s) already exist: {', '.join(taken)}")
+    # The rename waiting for each name to be freed
+    waiting = {new: old for old, new in pending.items() if new in pending}
+    ready = collections.deque(old for old, new in pending.items() if new not in pending)
+    steps: List[Tuple[str, str]] = []
+    temp_count = 0
+    while pending:
+        while ready:
+            old = ready.popleft()
+            steps.append((old, pending.pop(old)))
+            if old in waiting:
+                ready.append(waiting.pop(old))
+        if pending:
+            # Only cycles are left: park one file under a temporary name
+            old = next(iter(pending))
+            temp = f".rename-{batch_id}-{temp_count}.tmp"
+            temp_count += 1
+            steps.append((old, temp))
+            new = pending.pop(old)
+            pending[temp] = new
+            waiting[new] = temp
+            ready.append(waiting.pop(old))
+    return steps
+
+
+def _write_journal(path: str, journal: Dict) -> None:
+    """Write the journal durably before any rename is applied."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(journal, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@log_entry_exit
+def apply_renames(
+    renames: Dict[str, str],
+    functions_dir: str = FUNCTIONS_DIR,
+    journal_path: str = RENAME_JOURNAL_FILE,
+) -> List[Tuple[str, str]]:
+    """Rename function files as one journaled batch and move their saved state along.
+
+    The planned steps are written to an intent journal first. If a rename
+    fails, the steps already done are undone and the error is raised. If
+    the process dies mid-batch, recover_renames() completes the batch on
+    the next start. If the state store cannot be updated, the files are
+    renamed back and the sqlite3.Error is raised.
+
+    Args:
+        renames (Dict[str, str]): New name of each renamed file.
+
+    Returns:
+        List[Tuple[str, str]]: Applied (src, dst) steps.
+    """
+    batch_id = uuid.uuid4().hex[:8]
+    existing = set(os.listdir(functions_dir))
+    steps = plan_renames(renames, existing, batch_id)
+    if not steps:
+        return steps
+    _write_journal(journal_path, {"id": batch_id, "steps": steps})
+    done = []
+    try:
+        for src, dst in steps:
+            os.rename(os.path.join(functions_dir, src), os.path.join(functions_dir, dst))
+            done.append((src, dst))
+    except OSError as e:
+        LOGE(f"Rename {src} → {dst} failed, undoing {len(done)} rename(s): {e}")
+        for src, dst in reversed(done):
+            os.rename(os.path.join(functions_dir, dst), os.path.join(functions_dir, src))
+        os.remove(journal_path)
+        raise
+    try:
+        get_state_store().rename_functions(steps, (_LAST_BATCH_KEY, batch_id))
+    except sqlite3.Error as e:
+        LOGE(f"Saving the renames failed, undoing {len(done)} rename(s): {e}")
+        for src, dst in reversed(done):
+            os.rename(os.path.join(functions_dir, dst), os.path.join(functions_dir, src))
+        os.remove(journal_path)
+        raise
+    os.remove(journal_path)
+    LOGI(f"Renamed {len(renames)} function file(s) in {len(steps)} step(s)")
+    return steps
+
+
+@log_entry_exit
+def recover_renames(
+    functions_dir: str = FUNCTIONS_DIR, journal_path: str = RENAME_JOURNAL_FILE
+) -> bool:
+    """Complete a rename batch interrupted by a crash; return True if there was one.
+
+    Steps are rolled forward: a step whose source still exists and whose
+    target does not is applied, others are already done. The state store
+    part is skipped if the store already recorded the batch.
+    """
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            journal = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        LOGE(f"Unreadable rename journal {journal_path}, leaving it for inspection: {e}")
+        return False
+    steps = [tuple(step) for step in journal["steps"]]
+    for src, dst in steps:
+        src_path = os.path.join(functions_dir, src)
+        dst_path = os.path.join(functions_dir, dst)
+        if os.path.exists(src_path) and not os.path.exists(dst_path):
+            os.rename(src_path, dst_path)
+    store = get_state_store()
+    if store.get_setting(_LAST_BATCH_KEY) != journal["id"]:
+        store.rename_functions(steps, (_LAST_BATCH_KEY, journal["id"]))
+    os.remove(journal_path)
+    LOGW(f"Completed an interrupted batch of {len(steps)} rename step(s)")
+    return True
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from cfg.constants import RESULT_CACHE_FILE, RESULT_CACHE_SIZE
+from core.scheduler import read_literal
+from utils.log_util import *
+
+
+# Marker returned by ResultCache.get() when there is no usable entry
+MISS = object()
+
+
+class ResultCache:
+    """Persistent LRU cache of function results with per-function TTLs.
+
+    Entries are keyed by the script content hash, the account id and the
+    input arguments, so editing a script invalidates its results. Only
+    scripts that declare a module-level RESULT_TTL (seconds) are cached.
+    """
+
+    @log_entry_exit
+    def __init__(self, path: str = RESULT_CACHE_FILE, max_size: int = RESULT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[str, float, Any]]" = OrderedDict()
+        self._scripts: Dict[str, Tuple[Tuple[int, int], str, float]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def _script_info(self, filepath: str) -> Tuple[str, float]:
+        """Return (content hash, RESULT_TTL) of a script, re-reading it only when it changed."""
+        stat = os.stat(filepath)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._scripts.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        with open(filepath, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        ttl = read_literal(filepath, "RESULT_TTL", 0) or 0
+        try:
+            ttl = float(ttl)
+        except (TypeError, ValueError):
+            LOGW(f"Ignoring RESULT_TTL of {os.path.basename(filepath)}, not a number: {ttl!r}")
+            ttl = 0.0
+        with self._lock:
+            self._scripts[filepath] = (signature, digest, ttl)
+        return digest, ttl
+
+    @staticmethod
+    def _key(digest: str, account_id: Optional[str], args: Any) -> str:
+        """Build the cache key of one call."""
+        payload = json.dumps([digest, account_id, args], sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(
+        self, filepath: str, account_id: Optional[str] = None, args: Any = None
+    ) -> Tuple[Optional[str], Any]:
+        """Return (key, value) for a call; value is MISS if it is not cached.
+
+        The key is None when the script does not opt in to caching.
+        """
+        try:
+            digest, ttl = self._script_info(filepath)
+        except (OSError, SyntaxError, ValueError):
+            return None, MISS
+        if ttl <= 0:
+            return None, MISS
+        key = self._key(digest, account_id, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, entry[2]
+            if entry is not None:
+                del self._entries[key]
+                self._dirty = True
+            self.misses += 1
+        return key, MISS
+
+    def put(self, key: str, filepath: str, value: Any) -> None:
+        """Store a result under a key returned by get()."""
+        try:
+            pickle.dumps(value)
+        except Exception:
+            LOGD(f"Result of {filepath} is not picklable, not caching it")
+            return
+        _, ttl = self._script_info(filepath)
+        with self._lock:
+            self._entries[key] = (
+                os.path.basename(filepath),
+                time.time() + ttl,
+                value,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    @log_entry_exit
+    def invalidate(self, filename: Optional[str] = None) -> int:
+        """Drop the cached results of one function, or of all functions; return the count."""
+        with self._lock:
+            if filename is None:
+                keys = list(self._entries)
+            else:
+                keys = [k for k, e in self._entries.items() if e[0] == filename]
+            for key in keys:
+                del self._entries[key]
+            self._dirty = self._dirty or bool(keys)
+        LOGI(f"Invalidated {len(keys)} cached result(s) of {filename or 'all functions'}")
+        return len(keys)
+
+    @log_entry_exit
+    def load(self) -> None:
+        """Load the entries saved by a previous run, dropping expired ones."""
+        try:
+            with open(self.path, "rb") as f:
+                entries = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            LOGW(f"Ignoring unreadable result cache {self.path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            self._entries = OrderedDict(
+                (k, e) for k, e in entries.items() if e[1] > now
+            )
+        LOGD(f"Loaded {len(self._entries)} cached result(s)")
+
+    @log_entry_exit
+    def save(self) -> None:
+        """Write the entries to disk if they changed (atomic replace)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = pickle.dumps(self._entries, protocol=pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        LOGD(f"Saved result cache to {self.path}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and current cache size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
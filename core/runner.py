@@ -0,0 +1,877 @@
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+    wait,
+)
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from cfg.constants import (
+    ACCOUNT_CHUNK_SIZE,
+    ASYNC_MAX_CONCURRENCY,
+    FUNCTIONS_DIR,
+    RUN_ALL_MAX_WORKERS,
+    RUN_ALL_MODE,
+    RUN_MODES,
+    RUN_QUEUE_SIZE,
+    RUN_TIMEOUT,
+)
+from core.account_source import account_id, iter_chunks
+from core.async_loop import get_background_loop
+from core.metadata_index import FunctionMetadata, parse_metadata
+from core.module_cache import ModuleCache
+from core.result_cache import MISS, ResultCache
+from core.scheduler import (
+    build_graph,
+    has_dependencies,
+    read_literal,
+    topological_order,
+)
+from core.worker_pool import WorkerPool
+from utils.log_util import *
+
+
+# How often blocked waits wake up to check for cancellation (seconds)
+_CANCEL_POLL_INTERVAL = 0.2
+
+# RunResult.error of runs stopped by FunctionRunner.cancel()
+CANCELLED = "cancelled"
+
+
+class FunctionTimeout(Exception):
+    """Raised when a function run exceeds its timeout."""
+
+
+class _RunCancelled(Exception):
+    """Raised internally when waiting for a run stops because of cancel()."""
+
+
+class _NotAsync(Exception):
+    """Raised internally when a script classified as async has a synchronous main()."""
+
+
+@dataclass
+class RunResult:
+    """Outcome of a single function script run."""
+
+    filename: str
+    ok: bool
+    result: Any = None
+    error: Optional[str] = None
+    duration: float = 0.0
+    account: Optional[str] = None
+    cached: bool = False
+
+
+# Module cache of a process pool worker (one per worker process)
+_gProcessModuleCache: Optional[ModuleCache] = None
+
+
+def _run_in_process(
+    functions_dir: str,
+    filename: str,
+    account: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> RunResult:
+    """Process pool entry point: run a script with the worker's own module cache."""
+    global _gProcessModuleCache
+    if _gProcessModuleCache is None:
+        _gProcessModuleCache = ModuleCache()
+    result = execute_function(
+        _gProcessModuleCache, functions_dir, filename, account, timeout
+    )
+    try:
+        # Results go back over a pipe, so keep only what can be pickled
+        pickle.dumps(result.result)
+    except Exception:
+        result.result = repr(result.result)
+    return result
+
+
+def is_async_main(module: ModuleType) -> bool:
+    """Return True if the module defines "async def main()"."""
+    return inspect.iscoroutinefunction(getattr(module, "main", None))
+
+
+def _main_args(main, account: Optional[Dict]) -> tuple:
+    """Arguments for main(): the account row for per-account runs, if main() takes one."""
+    if account is None:
+        return ()
+    try:
+        takes_account = bool(inspect.signature(main).parameters)
+    except (TypeError, ValueError):
+        # No signature to inspect (e.g. some builtins): pass it and let the call decide
+        takes_account = True
+    return (account,) if takes_account else ()
+
+
+def _call_with_timeout(func, args: tuple, timeout: Optional[float]) -> Any:
+    """Call func(*args), giving up after timeout seconds.
+
+    A thread cannot be killed, so on timeout the call is left running in a
+    daemon thread and FunctionTimeout is raised; use the process or prefork
+    mode when hung scripts must really be stopped.
+    """
+    if not timeout:
+        return func(*args)
+    outcome: Dict[str, Any] = {}
+
+    def target() -> None:
+        try:
+            outcome["value"] = func(*args)
+        except BaseException as e:
+            outcome["error"] = e
+
+    # Keep the caller's trace context (correlation id) in the helper thread
+    context = contextvars.copy_context()
+    thread = threading.Thread(
+        target=context.run, args=(target,), name="run_with_timeout", daemon=True
+    )
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise FunctionTimeout(f"timed out after {timeout:g}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("value")
+
+
+async def _await_with_timeout(coro, timeout: Optional[float]) -> Any:
+    """Await coro, cancelling it and raising FunctionTimeout after timeout seconds."""
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        raise FunctionTimeout(f"timed out after {timeout:g}s")
+
+
+def _logged(result: RunResult) -> RunResult:
+    """Log the outcome of a run with account/function/duration fields and return it."""
+    if result.ok and not is_log_enabled(DEBUG):
+        return result
+    target = result.filename + (f" for {result.account}" if result.account else "")
+    fields = {
+        "account": result.account,
+        "function": result.filename,
+        "duration": round(result.duration, 6),
+    }
+    if result.ok:
+        LOGD(f"Ran {target} in {result.duration:.3f}s", **fields)
+    else:
+        LOGF(f"Failed to run {target}: {result.error}", **fields)
+    return result
+
+
+def execute_function(
+    module_cache: ModuleCache,
+    functions_dir: str,
+    filename: str,
+    account: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> RunResult:
+    """Load a function script through the module cache and call its main().
+
+    An "async def main()" is run on the shared background event loop. For
+    per-account runs the account row is passed as main(account), unless
+    main() takes no parameters. A run longer than timeout seconds, loading
+    the script included, fails with a "timed out" error.
+    """
+    with trace_context(account=account_id(account)):
+        return _execute_traced(module_cache, functions_dir, filename, account, timeout)
+
+
+def _execute_traced(
+    module_cache: ModuleCache,
+    functions_dir: str,
+    filename: str,
+    account: Optional[Dict],
+    timeout: Optional[float],
+) -> RunResult:
+    """execute_function body, run under the trace context of this run."""
+    filepath = os.path.join(functions_dir, filename)
+    acc_id = account_id(account)
+    start = time.perf_counter()
+    try:
+        # Loading runs the script's top-level code, so it counts against the timeout
+        module, value = _call_with_timeout(
+            _load_and_call, (module_cache, filepath, account), timeout
+        )
+        if module is None:
+            LOGW(f"{filename} has no main() function.")
+            return RunResult(
+                filename,
+                False,
+                None,
+                "no main() function",
+                time.perf_counter() - start,
+                acc_id,
+            )
+        if is_async_main(module):
+            left = None
+            if timeout:
+                left = timeout - (time.perf_counter() - start)
+                if left <= 0:
+                    raise FunctionTimeout()
+            args = _main_args(module.main, account)
+            value = get_background_loop().run(
+                _await_with_timeout(module.main(*args), left)
+            )
+        return _logged(
+            RunResult(filename, True, value, None, time.perf_counter() - start, acc_id)
+        )
+    except Exception as e:
+        error = str(e)
+        if isinstance(e, FunctionTimeout):
+            error = f"timed out after {timeout:g}s"
+        return _logged(
+            RunResult(filename, False, None, error, time.perf_counter() - start, acc_id)
+        )
+
+
+def _load_and_call(
+    module_cache: ModuleCache, filepath: str, account: Optional[Dict]
+) -> Tuple[Optional[ModuleType], Any]:
+    """Load a script and call a synchronous main(); return (module, value).
+
+    The module is None if the script has no main(). An async main() is not
+    called: the caller awaits it on the event loop.
+    """
+    module = module_cache.load(filepath)
+    if not hasattr(module, "main"):
+        return None, None
+    if is_async_main(module):
+        return module, None
+    return module, module.main(*_main_args(module.main, account))
+
+
+class FunctionRunner:
+    """Runs function scripts, one at a time or as a batch on a worker pool."""
+
+    @log_entry_exit
+    def __init__(
+        self,
+        functions_dir: str = FUNCTIONS_DIR,
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        async_limit: Optional[int] = None,
+        use_result_cache: bool = False,
+        timeout: Optional[float] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.functions_dir = functions_dir
+        self.mode = mode or RUN_ALL_MODE
+        self.max_workers = max_workers or RUN_ALL_MAX_WORKERS
+        self.async_limit = async_limit or ASYNC_MAX_CONCURRENCY
+        self.timeout = timeout if timeout is not None else RUN_TIMEOUT
+        self.queue_size = max(1, queue_size or RUN_QUEUE_SIZE)
+        self.cancel_event = threading.Event()
+        self._async_tasks: set = set()
+        self._timeouts: Dict[str, Tuple[Tuple[int, int], Optional[float]]] = {}
+        self._metadata_cache: Dict[str, Tuple[Tuple[int, int], FunctionMetadata]] = {}
+        if self.mode not in RUN_MODES:
+            raise ValueError(f"Unknown run mode: {self.mode}")
+        self.module_cache = ModuleCache()
+        self.result_cache: Optional[ResultCache] = (
+            ResultCache() if use_result_cache else None
+        )
+        self._worker_pool: Optional[WorkerPool] = None
+        if self.mode == "prefork":
+            # Warm the workers up front so the first run does not pay for them
+            self.worker_pool()
+
+    def worker_pool(self) -> WorkerPool:
+        """Return the prefork pool shared by all batches, starting it if needed."""
+        if self._worker_pool is None:
+            self._worker_pool = WorkerPool(self.max_workers)
+        return self._worker_pool
+
+    @log_entry_exit
+    def close(self) -> None:
+        """Release the prefork workers and persist the result cache."""
+        if self._worker_pool is not None:
+            self._worker_pool.shutdown()
+            self._worker_pool = None
+        if self.result_cache is not None:
+            LOGI(f"Result cache stats: {self.result_cache.stats()}")
+            self.result_cache.save()
+
+    @log_entry_exit
+    def cancel(self) -> None:
+        """Stop the running batch: queued runs are dropped and in-flight runs abandoned.
+
+        Async runs are cancelled and prefork workers busy with a run are
+        killed; a synchronous run in a thread keeps running in the
+        background but is no longer waited for.
+        """
+        LOGW("Cancelling running functions")
+        self.cancel_event.set()
+        loop = get_background_loop()
+        for task in list(self._async_tasks):
+            loop.call_soon_threadsafe(task.cancel)
+        if self._worker_pool is not None:
+            self._worker_pool.cancel_running()
+
+    def _start_batch(self) -> None:
+        """Reset the cancellation state before a new batch."""
+        self.cancel_event.clear()
+
+    def _end_batch(self) -> None:
+        """Persist the result cache after a batch, so a crash does not lose it."""
+        if self.result_cache is not None:
+            self.result_cache.save()
+
+    def _timeout_for(self, filename: str) -> Optional[float]:
+        """Return the script's TIMEOUT constant, or the runner's default timeout."""
+        filepath = os.path.join(self.functions_dir, filename)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return self.timeout
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._timeouts.get(filepath)
+        if cached is None or cached[0] != signature:
+            try:
+                value = read_literal(filepath, "TIMEOUT", None)
+                value = float(value) if value else None
+            except (OSError, SyntaxError, ValueError, TypeError) as e:
+                LOGW(f"Ignoring TIMEOUT of {filename}, using the default timeout: {e}")
+                value = None
+            cached = (signature, value)
+            self._timeouts[filepath] = cached
+        return cached[1] if cached[1] is not None else self.timeout
+
+    @staticmethod
+    def _cancelled_result(filename: str, account: Optional[Dict] = None) -> RunResult:
+        """Result of a run that was cancelled before it finished."""
+        return RunResult(filename, False, None, CANCELLED, 0.0, account_id(account))
+
+    @log_entry_exit
+    def invalidate_results(self, filename: Optional[str] = None) -> None:
+        """Drop cached results of one function, or of all functions."""
+        if self.result_cache is not None:
+            self.result_cache.invalidate(filename)
+
+    def _cache_lookup(
+        self, filename: str, account: Optional[Dict]
+    ) -> Tuple[Optional[RunResult], Optional[str]]:
+        """Return (cached result, None) on a hit, else (None, key to store the result under)."""
+        if self.result_cache is None:
+            return None, None
+        acc_id = account_id(account)
+        key, value = self.result_cache.get(
+            os.path.join(self.functions_dir, filename), acc_id, account
+        )
+        if value is MISS:
+            return None, key
+        if is_log_enabled(DEBUG):
+            LOGD(f"Result cache hit: {filename}{f' for {acc_id}' if acc_id else ''}")
+        return RunResult(filename, True, value, None, 0.0, acc_id, True), None
+
+    def _cache_store(self, key: Optional[str], result: RunResult) -> None:
+        """Remember a successful result under a key from _cache_lookup."""
+        if key is not None and result.ok:
+            self.result_cache.put(
+                key, os.path.join(self.functions_dir, result.filename), result.result
+            )
+
+    def _execute(self, filename: str, account: Optional[Dict] = None) -> RunResult:
+        """execute_function with cancellation and the result cache in front of it."""
+        if self.cancel_event.is_set():
+            return self._cancelled_result(filename, account)
+        cached, key = self._cache_lookup(filename, account)
+        if cached is not None:
+            return cached
+        result = execute_function(
+            self.module_cache,
+            self.functions_dir,
+            filename,
+            account,
+            self._timeout_for(filename),
+        )
+        self._cache_store(key, result)
+        return result
+
+    @log_entry_exit
+    def run(self, filename: str) -> RunResult:
+        """Run a single function and wait for it.
+
+        The run starts with a fresh cancellation state, and cancel() stops
+        waiting for it like for a batch run (the result is "cancelled").
+        """
+        self._start_batch()
+        with self._executor("thread", 1) as executor:
+            result = self._collect(
+                [(filename, None)], [self._submit(executor, "thread", filename)]
+            )[0]
+        self._end_batch()
+        LOGD(f"Module cache stats: {self.module_cache.stats()}")
+        return result
+
+    @log_entry_exit
+    def run_many(
+        self,
+        filenames: List[str],
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+    ) -> List[RunResult]:
+        """Run functions with the given mode; results keep the input order.
+
+        If scripts declare DEPENDS, the batch is scheduled as a DAG (see
+        _run_graph). Otherwise, outside of serial mode, "async def main()"
+        functions are gathered on the background event loop (at most
+        async_limit at once) while the synchronous ones run on the pool.
+        Raises DependencyError if a declaration is invalid or the
+        dependencies form a cycle (DependencyCycleError).
+        """
+        mode = mode or self.mode
+        max_workers = max(1, min(max_workers or self.max_workers, len(filenames) or 1))
+        start = time.perf_counter()
+        self._start_batch()
+        graph = build_graph(self.functions_dir, filenames)
+        if has_dependencies(graph):
+            order = topological_order(graph)
+            if mode == "serial" or (max_workers == 1 and mode != "prefork"):
+                by_name: Dict[str, RunResult] = {}
+                for filename in order:
+                    failed = [d for d in graph[filename] if not by_name[d].ok]
+                    if failed:
+                        LOGW(f"Skipping {filename}: dependency {failed[0]} failed")
+                        by_name[filename] = RunResult(
+                            filename, False, None, f"dependency {failed[0]} failed"
+                        )
+                    else:
+                        by_name[filename] = self._execute(filename)
+                results = [by_name[filename] for filename in filenames]
+            else:
+                results = self._run_graph(graph, mode, max_workers)
+        elif mode == "serial":
+            results = [self._execute(filename) for filename in filenames]
+        else:
+            async_entries, sync_entries = self._split_async(filenames, mode)
+            async_future = None
+            if async_entries:
+                async_future = get_background_loop().submit(
+                    self._gather_async(
+                        [(filename, None) for _, filename in async_entries]
+                    )
+                )
+            sync_filenames = [filename for _, filename in sync_entries]
+            if not sync_filenames:
+                sync_results = []
+            elif max_workers == 1 and mode != "prefork":
+                sync_results = [self._execute(filename) for filename in sync_filenames]
+            else:
+                sync_results = self._run_on_pool(sync_filenames, mode, max_workers)
+            results: List[Optional[RunResult]] = [None] * len(filenames)
+            for (idx, _), result in zip(sync_entries, sync_results):
+                results[idx] = result
+            if async_future is not None:
+                # Runs cancelled by cancel() come back as results, not errors
+                for (idx, _), result in zip(async_entries, async_future.result()):
+                    results[idx] = result
+        LOGI(
+            f"Ran {len(results)} function(s) in {mode} mode: "
+            f"{sum(r.ok for r in results)} ok, {sum(not r.ok for r in results)} failed, "
+            f"{time.perf_counter() - start:.3f}s"
+        )
+        self._end_batch()
+        return results
+
+    @log_entry_exit
+    def run_for_accounts(
+        self,
+        filename: str,
+        accounts: Iterable[Dict],
+        chunk_size: Optional[int] = None,
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+    ) -> Iterator[List[RunResult]]:
+        """Run one function as main(account) over a stream of accounts.
+
+        Accounts are read lazily: on a pool, at most queue_size runs are
+        queued or in flight and reading the source blocks until one
+        finishes (backpressure); async scripts are gathered chunk_size at a
+        time. The first accounts start before the source is exhausted.
+        Yields lists of at most chunk_size results, in account order, and
+        stops reading accounts once cancel() is called.
+        """
+        mode = mode or self.mode
+        chunk_size = max(1, chunk_size or ACCOUNT_CHUNK_SIZE)
+        max_workers = max(1, max_workers or self.max_workers)
+        self._start_batch()
+        use_loop = False
+        if mode not in ("process", "prefork"):
+            metadata = self._metadata(filename)
+            if metadata is None or metadata.error:
+                error = metadata.error if metadata is not None else "file not found"
+                LOGF(f"Failed to load {filename}: {error}")
+                return
+            use_loop = metadata.has_main and metadata.is_async
+        use_pool = (
+            mode != "serial" and (max_workers > 1 or mode == "prefork") and not use_loop
+        )
+
+        total = failed = 0
+        start = time.perf_counter()
+        if use_pool:
+            batches = self._stream_on_pool(
+                filename, accounts, chunk_size, mode, max_workers
+            )
+        else:
+            batches = self._stream_in_chunks(
+                filename, use_loop and mode != "serial", accounts, chunk_size
+            )
+        try:
+            for results in batches:
+                total += len(results)
+                failed += sum(not r.ok for r in results)
+                LOGD(f"{filename}: finished {len(results)} account run(s)")
+                yield results
+        finally:
+            # Also when the caller stops reading the results early
+            self._end_batch()
+        LOGI(
+            f"Ran {filename} for {total} account(s) in {mode} mode: "
+            f"{total - failed} ok, {failed} failed, "
+            f"{time.perf_counter() - start:.3f}s"
+        )
+
+    def _stream_in_chunks(
+        self,
+        filename: str,
+        use_loop: bool,
+        accounts: Iterable[Dict],
+        chunk_size: int,
+    ) -> Iterator[List[RunResult]]:
+        """Run accounts chunk by chunk, gathered on the event loop when use_loop is set."""
+        for chunk in iter_chunks(accounts, chunk_size):
+            if self.cancel_event.is_set():
+                return
+            if use_loop:
+                yield get_background_loop().run(
+                    self._gather_async([(filename, account) for account in chunk])
+                )
+            else:
+                yield [self._execute(filename, account) for account in chunk]
+
+    def _stream_on_pool(
+        self,
+        filename: str,
+        accounts: Iterable[Dict],
+        chunk_size: int,
+        mode: str,
+        max_workers: int,
+    ) -> Iterator[List[RunResult]]:
+        """Keep at most queue_size account runs submitted, yielding finished ones in order."""
+        slots = threading.BoundedSemaphore(self.queue_size)
+        window: deque = deque()
+        done: List[RunResult] = []
+        with self._executor(mode, max_workers) as executor:
+            for account in accounts:
+                # Backpressure: wait for a free slot before reading further
+                while not slots.acquire(timeout=_CANCEL_POLL_INTERVAL):
+                    if self.cancel_event.is_set():
+                        break
+                if self.cancel_event.is_set():
+                    break
+                future = self._submit(executor, mode, filename, account)
+                future.add_done_callback(lambda _: slots.release())
+                window.append((account, future))
+                while window and window[0][1].done():
+                    account_done, future_done = window.popleft()
+                    done.extend(self._collect([(filename, account_done)], [future_done]))
+                if len(done) >= chunk_size:
+                    yield done
+                    done = []
+            while window:
+                account_done, future_done = window.popleft()
+                done.extend(self._collect([(filename, account_done)], [future_done]))
+                if len(done) >= chunk_size:
+                    yield done
+                    done = []
+        if done:
+            yield done
+
+    def _run_graph(
+        self, graph: Dict[str, List[str]], mode: str, max_workers: int
+    ) -> List[RunResult]:
+        """Run a dependency graph, starting every node as soon as its dependencies succeed.
+
+        Dependents of a failed function are skipped. Results keep the graph order.
+        """
+        dependents: Dict[str, List[str]] = {node: [] for node in graph}
+        for node, deps in graph.items():
+            for dep in deps:
+                dependents[dep].append(node)
+        remaining = {node: len(deps) for node, deps in graph.items()}
+        results: Dict[str, RunResult] = {}
+
+        def skip(node: str, failed: str) -> None:
+            for child in dependents[node]:
+                if child not in results:
+                    LOGW(f"Skipping {child}: dependency {failed} failed")
+                    results[child] = RunResult(
+                        child, False, None, f"dependency {failed} failed"
+                    )
+                    skip(child, failed)
+
+        with self._executor(mode, max_workers) as executor:
+            running = {
+                self._submit(executor, mode, node): node
+                for node in graph
+                if remaining[node] == 0
+            }
+            while running:
+                done, _ = wait(
+                    running, timeout=_CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                if self.cancel_event.is_set():
+                    for future in running:
+                        future.cancel()
+                    for node in graph:
+                        if node not in results:
+                            results[node] = self._cancelled_result(node)
+                    break
+                for future in done:
+                    node = running.pop(future)
+                    results[node] = self._collect([(node, None)], [future])[0]
+                    if not results[node].ok:
+                        skip(node, node)
+                        continue
+                    for child in dependents[node]:
+                        remaining[child] -= 1
+                        if remaining[child] == 0 and child not in results:
+                            running[self._submit(executor, mode, child)] = child
+        return [results[node] for node in graph]
+
+    def _metadata(self, filename: str) -> Optional[FunctionMetadata]:
+        """Return the ast metadata of a script, cached by file signature; None if it is missing."""
+        filepath = os.path.join(self.functions_dir, filename)
+        try:
+            stat = os.stat(filepath)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._metadata_cache.get(filepath)
+            if cached is None or cached[0] != signature:
+                cached = (signature, parse_metadata(filepath))
+                self._metadata_cache[filepath] = cached
+        except OSError:
+            return None
+        return cached[1]
+
+    def _split_async(
+        self, filenames: List[str], mode: str
+    ) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+        """Split a batch into (idx, filename) async and sync entries.
+
+        Scripts are classified by reading them with ast, without executing
+        them; they are loaded where they run (pool workers or the event
+        loop's executor), so cold loads run in parallel and under the timeout.
+        """
+        async_entries = []
+        sync_entries = []
+        for idx, filename in enumerate(filenames):
+            metadata = None
+            if mode not in ("process", "prefork"):
+                metadata = self._metadata(filename)
+            if metadata is not None and metadata.has_main and metadata.is_async:
+                async_entries.append((idx, filename))
+            else:
+                # The regular run path also reports missing and broken scripts
+                sync_entries.append((idx, filename))
+        return async_entries, sync_entries
+
+    async def _load_and_await(self, filename: str, account: Optional[Dict]) -> Any:
+        """Load a script off the event loop thread and await its async main().
+
+        Raises _NotAsync if the loaded main() turns out not to be async.
+        """
+        filepath = os.path.join(self.functions_dir, filename)
+        # Keep the trace context so the script's top-level logs are tagged too
+        module = await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, self.module_cache.load, filepath
+        )
+        if not is_async_main(module):
+            raise _NotAsync()
+        return await module.main(*_main_args(module.main, account))
+
+    async def _gather_async(
+        self, entries: List[Tuple[str, Optional[Dict]]]
+    ) -> List[RunResult]:
+        """Await many (filename, account) async main() calls at once, bounded by a semaphore."""
+        semaphore = asyncio.Semaphore(self.async_limit)
+
+        async def run_one(filename: str, account: Optional[Dict]) -> RunResult:
+            # Each gathered run is its own task, hence its own trace context
+            with trace_context(account=account_id(account)):
+                return await run_traced(filename, account)
+
+        async def run_traced(filename: str, account: Optional[Dict]) -> RunResult:
+            acc_id = account_id(account)
+            cached, key = self._cache_lookup(filename, account)
+            if cached is not None:
+                return cached
+            async with semaphore:
+                if self.cancel_event.is_set():
+                    return self._cancelled_result(filename, account)
+                start = time.perf_counter()
+                # Loading counts against the timeout like in execute_function
+                task = asyncio.ensure_future(self._load_and_await(filename, account))
+                self._async_tasks.add(task)
+                try:
+                    value = await _await_with_timeout(task, self._timeout_for(filename))
+                    result = _logged(
+                        RunResult(
+                            filename,
+                            True,
+                            value,
+                            None,
+                            time.perf_counter() - start,
+                            acc_id,
+                        )
+                    )
+                    self._cache_store(key, result)
+                    return result
+                except asyncio.CancelledError:
+                    if not self.cancel_event.is_set():
+                        raise
+                    return self._cancelled_result(filename, account)
+                except _NotAsync:
+                    # main() is not what the ast said (e.g. assigned at runtime)
+                    return await asyncio.get_running_loop().run_in_executor(
+                        None, self._execute, filename, account
+                    )
+                except Exception as e:
+                    return _logged(
+                        RunResult(
+                            filename,
+                            False,
+                            None,
+                            str(e),
+                            time.perf_counter() - start,
+                            acc_id,
+                        )
+                    )
+                finally:
+                    self._async_tasks.discard(task)
+
+        return await asyncio.gather(
+            *(run_one(filename, account) for filename, account in entries)
+        )
+
+    @contextlib.contextmanager
+    def _executor(self, mode: str, max_workers: int) -> Iterator[Executor]:
+        """Provide the pool for the given mode.
+
+        Thread and process pools live for one batch; the prefork pool is
+        shared and stays up until close().
+        """
+        if mode == "prefork":
+            yield self.worker_pool()
+            return
+        if mode == "process":
+            # Forking a parent that runs the event loop and pool threads can
+            # deadlock the children, so always start clean interpreters
+            executor: Executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=apply_log_settings,
+                initargs=(get_log_settings(),),
+            )
+        elif mode == "thread":
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="run_all"
+            )
+        else:
+            raise ValueError(f"Unknown run mode: {mode}")
+        try:
+            yield executor
+        finally:
+            # After cancel(), drop queued runs and do not wait for abandoned ones
+            cancelled = self.cancel_event.is_set()
+            executor.shutdown(wait=not cancelled, cancel_futures=cancelled)
+
+    def _submit(
+        self,
+        executor: Executor,
+        mode: str,
+        filename: str,
+        account: Optional[Dict] = None,
+    ) -> Future:
+        """Submit one run of a function to a pool provided by _executor."""
+        if mode not in ("process", "prefork"):
+            return executor.submit(self._execute, filename, account)
+        cached, key = self._cache_lookup(filename, account)
+        if cached is None and self.cancel_event.is_set():
+            cached = self._cancelled_result(filename, account)
+        if cached is not None:
+            future: Future = Future()
+            future.set_result(cached)
+            return future
+        future = executor.submit(
+            _run_in_process,
+            self.functions_dir,
+            filename,
+            account,
+            self._timeout_for(filename),
+        )
+        if key is not None:
+            future.add_done_callback(
+                lambda f: f.exception() is None and self._cache_store(key, f.result())
+            )
+        return future
+
+    def _wait(self, future: Future) -> RunResult:
+        """Wait for a run, raising _RunCancelled if cancel() is called meanwhile."""
+        while True:
+            try:
+                return future.result(timeout=_CANCEL_POLL_INTERVAL)
+            except FutureTimeoutError:
+                if self.cancel_event.is_set():
+                    future.cancel()
+                    raise _RunCancelled()
+
+    def _collect(
+        self, jobs: List[Tuple[str, Optional[Dict]]], futures: List[Future]
+    ) -> List[RunResult]:
+        """Wait for (filename, account) futures in order, turning pool errors into failed results."""
+        results = []
+        for (filename, account), future in zip(jobs, futures):
+            try:
+                results.append(self._wait(future))
+            except _RunCancelled:
+                results.append(self._cancelled_result(filename, account))
+            except Exception as e:
+                if self.cancel_event.is_set():
+                    # Cancelled queued runs and killed prefork workers
+                    results.append(self._cancelled_result(filename, account))
+                    continue
+                LOGF(f"Failed to run {filename}: {e}")
+                results.append(
+                    RunResult(filename, False, None, str(e), 0.0, account_id(account))
+                )
+        return results
+
+    def _run_on_pool(
+        self, filenames: List[str], mode: str, max_workers: int
+    ) -> List[RunResult]:
+        """Submit every function to a pool and collect results in input order."""
+        with self._executor(mode, max_workers) as executor:
+            futures = [
+                self._submit(executor, mode, filename) for filename in filenames
+            ]
+            return self._collect(
+                [(filename, None) for filename in filenames], futures
+            )
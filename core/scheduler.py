@@ -0,0 +1,134 @@
+import ast
+import os
+from typing import Any, Dict, List
+from utils.log_util import *
+
+
+class DependencyError(ValueError):
+    """Raised when function DEPENDS declarations cannot be scheduled."""
+
+
+class DependencyCycleError(DependencyError):
+    """Raised when function DEPENDS declarations form a cycle."""
+
+
+def normalize_name(name: str) -> str:
+    """Return the function file name for a dependency given with or without ".py"."""
+    name = name.strip()
+    return name if name.endswith(".py") else name + ".py"
+
+
+def read_literal(filepath: str, name: str, default: Any = None) -> Any:
+    """Read the literal value of a module-level constant without executing the script."""
+    with open(filepath, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=filepath)
+    return literal_from_tree(tree, name, default, filepath)
+
+
+def literal_from_tree(tree: ast.Module, name: str, default: Any, filepath: str) -> Any:
+    """Read the literal value of a module-level constant from a parsed script."""
+    value = default
+    # Like at runtime, the last module-level assignment wins
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == name
+            for target in node.targets
+        ):
+            try:
+                value = ast.literal_eval(node.value)
+            except ValueError:
+                LOGW(f"{filepath}: {name} must be a literal value")
+                value = default
+    return value
+
+
+@log_entry_exit
+def read_dependencies(filepath: str) -> List[str]:
+    """Read a script's module-level DEPENDS = [...] without executing it.
+
+    Raises DependencyError if DEPENDS is not a name or a list of names.
+    """
+    value = read_literal(filepath, "DEPENDS", [])
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not all(
+        isinstance(name, str) for name in value
+    ):
+        raise DependencyError(
+            f"{os.path.basename(filepath)}: DEPENDS must be a function name or a list"
+            f" of names, not {value!r}"
+        )
+    return [normalize_name(name) for name in value]
+
+
+@log_entry_exit
+def build_graph(functions_dir: str, filenames: List[str]) -> Dict[str, List[str]]:
+    """Map each function of the batch to the batch functions it depends on.
+
+    Dependencies that are not part of the batch are ignored with a warning,
+    so running a single function never pulls in others. Raises
+    DependencyError for an invalid declaration.
+    """
+    selected = set(filenames)
+    graph = {}
+    for filename in filenames:
+        try:
+            depends = read_dependencies(os.path.join(functions_dir, filename))
+        except (OSError, SyntaxError) as e:
+            # The run itself reports unreadable scripts
+            LOGD(f"Cannot read dependencies of {filename}: {e}")
+            depends = []
+        graph[filename] = []
+        for dep in depends:
+            if dep == filename:
+                raise DependencyCycleError(f"{filename} depends on itself")
+            if dep in selected:
+                graph[filename].append(dep)
+            else:
+                LOGW(f"{filename}: dependency {dep} is not in this run, ignoring it")
+    return graph
+
+
+def has_dependencies(graph: Dict[str, List[str]]) -> bool:
+    """Return True if any node of the graph has an edge."""
+    return any(graph.values())
+
+
+def topological_order(graph: Dict[str, List[str]]) -> List[str]:
+    """Order nodes so every dependency comes first, keeping the input order otherwise.
+
+    Raises DependencyCycleError naming the nodes of a cycle.
+    """
+    remaining = {node: len(deps) for node, deps in graph.items()}
+    dependents: Dict[str, List[str]] = {node: [] for node in graph}
+    for node, deps in graph.items():
+        for dep in deps:
+            dependents[dep].append(node)
+
+    position = {node: idx for idx, node in enumerate(graph)}
+    ready = [node for node in graph if remaining[node] == 0]
+    order = []
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        for child in dependents[node]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+                ready.sort(key=position.get)
+
+    if len(order) != len(graph):
+        raise DependencyCycleError(
+            "Dependency cycle between: " + ", ".join(_find_cycle(graph, set(order)))
+        )
+    return order
+
+
+def _find_cycle(graph: Dict[str, List[str]], done: set) -> List[str]:
+    """Return the nodes of one cycle among the nodes not in done."""
+    node = next(n for n in graph if n not in done)
+    path: List[str] = []
+    while node not in path:
+        path.append(node)
+        node = next(dep for dep in graph[node] if dep not in done)
+    return path[path.index(node) :] + [node]
@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from cfg.constants import ORDER_FILE, STATE_DB_FILE, WINDOW_SIZE_FILE
+from utils.log_util import *
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS functions (
+    filename TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    display_name TEXT NOT NULL,
+    checked INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS function_settings (
+    filename TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (filename, key)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# State of one function row: (position, display name, checked)
+FunctionState = Tuple[int, str, bool]
+
+
+class StateStore:
+    """Embedded SQLite (WAL mode) store of the app state.
+
+    Holds the function order, display names and check states, per-function
+    settings and app settings such as the window geometry. Saves are
+    diffed against the last saved state and written as one transaction
+    touching only the changed rows, so a crash never leaves a half-written
+    order behind. The legacy .order and window_size.json files are imported
+    the first time the store is created.
+    """
+
+    @log_entry_exit
+    def __init__(self, path: str = STATE_DB_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(path)
+        self._lock = threading.Lock()
+        # Autocommit; transactions are opened explicitly in _transaction()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._functions: Dict[str, FunctionState] = {
+            filename: (position, display_name, bool(checked))
+            for filename, position, display_name, checked in self._conn.execute(
+                "SELECT filename, position, display_name, checked FROM functions"
+            )
+        }
+        if is_new:
+            self._import_legacy_files()
+
+    def _transaction(self, statements: List[Tuple[str, List[tuple]]]) -> None:
+        """Run (sql, rows) batches in one transaction; the caller holds the lock."""
+        cursor = self._conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in statements:
+                if rows:
+                    cursor.executemany(sql, rows)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def _import_legacy_files(self) -> None:
+        """Import the order of .order and the size of window_size.json, if they exist."""
+        if os.path.exists(ORDER_FILE):
+            with open(ORDER_FILE, "r") as f:
+                filenames = [line.strip() for line in f if line.strip()]
+            self.save_functions([(filename, filename, False) for filename in filenames])
+            LOGI(f"Imported the order of {len(filenames)} function(s) from {ORDER_FILE}")
+        try:
+            with open(WINDOW_SIZE_FILE, "r") as f:
+                self.set_setting("window_size", json.load(f))
+            LOGI(f"Imported the window size from {WINDOW_SIZE_FILE}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            LOGW(f"Ignoring unreadable {WINDOW_SIZE_FILE}: {e}")
+
+    def functions(self) -> Dict[str, FunctionState]:
+        """Return the saved state of every function by file name."""
+        with self._lock:
+            return dict(self._functions)
+
+    def function_order(self) -> List[str]:
+        """Return the saved function file names in order."""
+        with self._lock:
+            return sorted(self._functions, key=lambda name: self._functions[name][0])
+
+    @log_entry_exit
+    def save_functions(self, rows: List[Tuple[str, str, bool]]) -> int:
+        """Save the functions as ordered (filename, display name, checked) rows.
+
+        Only the rows that differ from the saved state are written, and
+        functions missing from rows are removed. Returns the number of rows
+        written or deleted.
+        """
+        state = {
+            filename: (position, display_name, bool(checked))
+            for position, (filename, display_name, checked) in enumerate(rows)
+        }
+        with self._lock:
+            changed = [
+                (filename, position, display_name, int(checked))
+                for filename, (position, display_name, checked) in state.items()
+                if self._functions.get(filename) != (position, display_name, checked)
+            ]
+            removed = [(filename,) for filename in self._functions if filename not in state]
+            if not changed and not removed:
+                return 0
+            self._transaction(
+                [
+                    (
+                        "INSERT OR REPLACE INTO functions"
+                        " (filename, position, display_name, checked) VALUES (?, ?, ?, ?)",
+                        changed,
+                    ),
+                    ("DELETE FROM functions WHERE filename = ?", removed),
+                    ("DELETE FROM function_settings WHERE filename = ?", removed),
+                ]
+            )
+            self._functions = state
+        LOGD(f"State store: wrote {len(changed)} and deleted {len(removed)} function row(s)")
+        return len(changed) + len(removed)
+
+    def rename_function(self, old_name: str, new_name: str) -> None:
+        """Move the saved state and settings of a function to its new file name."""
+        self.rename_functions([(old_name, new_name)])
+
+    @log_entry_exit
+    def rename_functions(
+        self, steps: List[Tuple[str, str]], setting: Optional[Tuple[str, Any]] = None
+    ) -> None:
+        """Apply (old, new) renames in order in one transaction, optionally saving a setting with them."""
+        statements: List[Tuple[str, List[tuple]]] = []
+        with self._lock:
+            functions = dict(self._functions)
+            for old_name, new_name in steps:
+                state = functions.pop(old_name, None)
+                if state is None:
+                    continue
+                functions[new_name] = state
+                statements += [
+                    ("DELETE FROM functions WHERE filename = ?", [(new_name,)]),
+                    ("DELETE FROM function_settings WHERE filename = ?", [(new_name,)]),
+                    (
+                        "UPDATE functions SET filename = ? WHERE filename = ?",
+                        [(new_name, old_name)],
+                    ),
+                    (
+                        "UPDATE function_settings SET filename = ? WHERE filename = ?",
+                        [(new_name, old_name)],
+                    ),
+                ]
+            if setting is not None:
+                statements.append(
+                    (
+                        "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                        [(setting[0], json.dumps(setting[1]))],
+                    )
+                )
+            if statements:
+                self._transaction(statements)
+            self._functions = functions
+
+    def get_setting(self, key: str, default: Any = None) -> Any:
+        """Return an app setting, or default if it was never saved."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM settings WHERE key = ?", (key,)
+            ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_setting(self, key: str, value: Any) -> None:
+        """Save an app setting (any JSON value)."""
+        with self._lock:
+            self._transaction(
+                [
+                    (
+                        "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                        [(key, json.dumps(value))],
+                    )
+                ]
+            )
+
+    def get_function_setting(self, filename: str, key: str, default: Any = None) -> Any:
+        """Return a setting of one function, or default if it was never saved."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM function_settings WHERE filename = ? AND key = ?",
+                (filename, key),
+            ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_function_setting(self, filename: str, key: str, value: Any) -> None:
+        """Save a setting of one function (any JSON value)."""
+        with self._lock:
+            self._transaction(
+                [
+                    (
+                        "INSERT OR REPLACE INTO function_settings (filename, key, value)"
+                        " VALUES (?, ?, ?)",
+                        [(filename, key, json.dumps(value))],
+                    )
+                ]
+            )
+
+    @log_entry_exit
+    def close(self) -> None:
+        """Checkpoint the WAL and close the database."""
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                self._conn.close()
+
+
+_gStateStore: Optional[StateStore] = None
+_gStateStoreLock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Return the process-wide state store, opening STATE_DB_FILE on first use."""
+    global _gStateStore
+    with _gStateStoreLock:
+        if _gStateStore is None:
+            _gStateStore = StateStore()
+        return _gStateStore
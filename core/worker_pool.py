@@ -0,0 +1,254 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Dict, List, Optional
+from cfg.constants import WORKER_MAX_JOBS, WORKER_MAX_RSS_MB, WORKER_PRELOAD_MODULES
+from utils.log_util import *
+
+
+def _rss_mb() -> Optional[float]:
+    """Return the resident memory of the current process in MB, if it can be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        # Peak rather than current RSS; KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if peak > 2**32 else peak / 2**10
+    except (ImportError, AttributeError):
+        return None
+
+
+def _worker_main(
+    conn, preload: List[str], max_jobs: int, max_rss_mb: float, log_settings: Dict
+) -> None:
+    """Worker process loop: preload modules, then run (fn, args, kwargs) jobs from the pipe.
+
+    Every reply is ((ok, value), recycle); the worker exits after a reply
+    with recycle set, once it ran max_jobs jobs, grew past max_rss_mb or
+    was left with threads of a timed out run.
+    """
+    apply_log_settings(log_settings)
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            LOGD(f"Worker {os.getpid()}: cannot preload {name}")
+    jobs = 0
+    baseline_threads = threading.active_count()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        fn, args, kwargs = job
+        try:
+            payload = (True, fn(*args, **kwargs))
+        except Exception as e:
+            payload = (False, e)
+        jobs += 1
+        rss = _rss_mb()
+        recycle = (
+            jobs >= max_jobs
+            or (rss is not None and rss > max_rss_mb)
+            or threading.active_count() > baseline_threads
+        )
+        try:
+            conn.send((payload, recycle))
+        except Exception as e:
+            # The result or exception could not be pickled
+            conn.send(((False, RuntimeError(f"Unpicklable job outcome: {e}")), recycle))
+        if recycle:
+            return
+
+
+class _Worker:
+    """One warm worker process and the parent end of its pipe."""
+
+    def __init__(self, ctx, preload: List[str], max_jobs: int, max_rss_mb: float):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            # Taken at spawn time, so replacement workers follow later changes
+            args=(child_conn, preload, max_jobs, max_rss_mb, get_log_settings()),
+            name="prefork_worker",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, graceful: bool = True) -> None:
+        """Ask the worker to exit (or kill it) and reap the process."""
+        if graceful and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(Executor):
+    """Pool of long-lived, preloaded worker processes fed over pipes.
+
+    Workers are spawned when the pool is created, so the interpreter start
+    and heavy imports are paid once, and are replaced after WORKER_MAX_JOBS
+    jobs or when their memory passes WORKER_MAX_RSS_MB. Jobs must be
+    picklable, like with ProcessPoolExecutor.
+    """
+
+    @log_entry_exit
+    def __init__(
+        self,
+        size: int,
+        preload: Optional[List[str]] = None,
+        max_jobs: int = WORKER_MAX_JOBS,
+        max_rss_mb: float = WORKER_MAX_RSS_MB,
+    ):
+        self.size = max(1, size)
+        self.preload = list(WORKER_PRELOAD_MODULES if preload is None else preload)
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.jobs_done = 0
+        self.recycled = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._busy: Dict[int, _Worker] = {}
+        self._threads = [
+            threading.Thread(
+                target=self._serve, args=(idx,), name=f"prefork_{idx}", daemon=True
+            )
+            for idx in range(self.size)
+        ]
+        for thread in self._threads:
+            thread.start()
+        LOGI(f"Started {self.size} prefork worker(s)")
+
+    def _spawn(self) -> _Worker:
+        """Start a new warm worker process."""
+        return _Worker(self._ctx, self.preload, self.max_jobs, self.max_rss_mb)
+
+    def _serve(self, idx: int) -> None:
+        """Feed jobs from the queue to one worker process, replacing it when needed."""
+        worker = self._spawn()
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                worker.stop()
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._busy[idx] = worker
+            try:
+                worker.conn.send((fn, args, kwargs))
+                (ok, value), recycle = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                with self._lock:
+                    self._busy.pop(idx, None)
+                LOGE(f"Worker process {worker.process.pid} died: {e!r}")
+                future.set_exception(
+                    RuntimeError(f"Worker process {worker.process.pid} died")
+                )
+                worker.stop(graceful=False)
+                worker = self._spawn()
+                continue
+            except Exception as e:
+                # The job could not be pickled (nothing was sent) or its
+                # reply could not be unpickled; the worker is still usable
+                with self._lock:
+                    self._busy.pop(idx, None)
+                LOGE(f"Prefork job {getattr(fn, '__name__', fn)} failed to transfer: {e!r}")
+                future.set_exception(e)
+                continue
+            with self._lock:
+                self._busy.pop(idx, None)
+                self.jobs_done += 1
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+            if recycle:
+                LOGD(f"Recycling worker process {worker.process.pid}")
+                worker.stop()
+                worker = self._spawn()
+                with self._lock:
+                    self.recycled += 1
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) for the next free worker."""
+        if self._shutdown:
+            raise RuntimeError("cannot submit to a pool that was shut down")
+        future: Future = Future()
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    @log_entry_exit
+    def cancel_running(self) -> int:
+        """Cancel the queued jobs and kill the workers busy with a job; return the kill count.
+
+        The futures of killed jobs fail with RuntimeError and the workers are
+        replaced, so the pool stays usable.
+        """
+        self._cancel_queued()
+        with self._lock:
+            busy = list(self._busy.values())
+        for worker in busy:
+            if worker.process.is_alive():
+                worker.process.kill()
+        if busy:
+            LOGW(f"Killed {len(busy)} busy prefork worker(s)")
+        return len(busy)
+
+    def _cancel_queued(self) -> None:
+        """Cancel the futures of jobs no worker picked up yet, keeping stop markers."""
+        stops = 0
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stops += 1
+            else:
+                item[0].cancel()
+        for _ in range(stops):
+            self._jobs.put(None)
+
+    @log_entry_exit
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """Stop every worker once the queued jobs are done."""
+        if self._shutdown:
+            return
+        self._shutdown = True
+        if cancel_futures:
+            self._cancel_queued()
+        for _ in self._threads:
+            self._jobs.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        LOGI(f"Prefork pool stats: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size and job/recycle counters."""
+        return {
+            "workers": self.size,
+            "jobs_done": self.jobs_done,
+            "recycled": self.recycled,
+        }
@@ -23,6 +23,7 @@ class UI:
         self.move_buttons: list = []
         self.edit_save_button: Optional[ttk.Button] = None
         self.background_frame: Optional[CustomFrame] = None
+        self.filter_var = tk.StringVar()
         self._is_background_light = True
         self.create_widgets()
 
@@ -67,8 +68,19 @@ class UI:
         self.edit_save_button.grid(row=0, column=1, padx=5)
         Tooltip(self.edit_save_button, "Edit function names and order")
 
+        # Metadata filter
+        ttk.Label(control_frame, text="Filter:").grid(row=0, column=2, padx=(15, 2))
+        filter_entry = ttk.Entry(control_frame, textvariable=self.filter_var, width=25)
+        filter_entry.grid(row=0, column=3, padx=5)
+        Tooltip(
+            filter_entry,
+            "Words to match in names, docstrings, tags and imports\n"
+            "tag:<name>, import:<module>, async, sync, nomain",
+        )
+        self.filter_var.trace_add("write", lambda *args: self.apply_filter())
+
     def _create_second_row(self, main_frame: CustomFrame) -> None:
-        """Create the second row with Check/Uncheck, Run All, and move buttons."""
+        """Create the second row with Check/Uncheck, Run All/Cancel, and move buttons."""
         second_row_frame = CustomFrame(main_frame, background="white")
         second_row_frame.grid(row=1, column=0, sticky="ew", pady=(0, 20))
         second_row_frame.grid_columnconfigure(0, weight=0)
@@ -83,13 +95,22 @@ class UI:
         )
         btn_check_all.grid(row=0, column=0, padx=(10, 10), sticky="w")
 
-        # Run All button
+        # Run All and Cancel buttons
+        run_frame = CustomFrame(second_row_frame, background="white")
+        run_frame.grid(row=0, column=2, padx=(10, 34), sticky="e")
         btn_run_all = ttk.Button(
-            second_row_frame,
+            run_frame,
             text="Run All",
             command=self.app.function_manager.run_all,
         )
-        btn_run_all.grid(row=0, column=2, padx=(10, 34), sticky="e")
+        btn_run_all.grid(row=0, column=0)
+        btn_cancel = ttk.Button(
+            run_frame,
+            text="Cancel",
+            command=self.app.function_manager.cancel_run,
+        )
+        btn_cancel.grid(row=0, column=1, padx=(5, 0))
+        Tooltip(btn_cancel, "Cancel the running Run All batch")
 
         # Move buttons and sort combobox
         self._create_move_controls(second_row_frame)
@@ -227,8 +248,45 @@ class UI:
             "entry": entry_name,
             "run_button": btn_run,
             "label_idx": lbl_idx,
+            "tooltip": Tooltip(entry_name, ""),
         }
 
+    def row_visible(self, row: Dict) -> bool:
+        """Return True if a row matches the current filter."""
+        query = self.filter_var.get()
+        if not query.strip():
+            return True
+        return bool(self.app.function_manager.metadata.filter([row["filename"]], query))
+
+    def apply_filter(self) -> None:
+        """Show only the rows matching the filter, in their current order."""
+        query = self.filter_var.get()
+        rows = self.app.function_manager.function_rows
+        visible = set(self.app.function_manager.visible_functions(query))
+        for row in rows:
+            row["frame"].pack_forget()
+        for row in rows:
+            if row["filename"] in visible:
+                row["frame"].pack(fill="x", pady=2)
+        self.update_scrollregion()
+
+    def renumber_rows(self, start: int = 0) -> None:
+        """Update the numbers and row callbacks of the rows from index start on."""
+        rows = self.app.function_manager.function_rows
+        for idx in range(start, len(rows)):
+            row = rows[idx]
+            row["label_idx"].config(text=f"No.{idx + 1:03}")
+            row["frame"].children["!checkbutton"].bind(
+                "<Button-1>", lambda e, r=idx: self.app.select_row(r)
+            )
+            row["entry"].bind("<FocusIn>", lambda e, r=idx: self.app.select_row(r))
+            row["run_button"].config(
+                command=lambda nv=row["name_var"], r=idx: (
+                    self.app.select_row(r),
+                    self.app.function_manager.run_function(nv.get()),
+                )
+            )
+
     def update_scrollregion(self) -> None:
         """Update the scroll region of the canvas."""
         self.functions_canvas.configure(scrollregion=self.functions_canvas.bbox("all"))
@@ -243,20 +301,21 @@ class UI:
             row["frame"].pack_forget()
 
         for idx, row in enumerate(self.app.function_manager.function_rows, start=1):
-            row["filename"] = row["name_var"].get()
             row["label_idx"].config(text=f"No.{idx:03}")
             row["entry"].config(
                 textvariable=row["name_var"],
                 state="normal" if self.app.edit_mode else "readonly",
             )
             row["frame"].children["!checkbutton"].config(variable=row["check_var"])
+            row["tooltip"].text = self.app.function_manager.describe(row["filename"])
             row["run_button"].config(
                 command=lambda nv=row["name_var"], r=idx - 1: (
                     self.app.select_row(r),
                     self.app.function_manager.run_function(nv.get()),
                 )
             )
-            row["frame"].pack(fill="x", pady=2)
+            if self.row_visible(row):
+                row["frame"].pack(fill="x", pady=2)
 
         while len(self.functions_frame.winfo_children()) > len(
             self.app.function_manager.function_rows
@@ -270,3 +329,4 @@ class UI:
             self.app.selected_row if self.app.selected_row is not None else -1
         )
         self.update_scrollregion()
+        self.app.mark_dirty("functions")
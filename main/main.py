@@ -1,9 +1,86 @@
-import tkinter as tk
-from core.app import FunctionRunnerApp  # Absolute import
+import sys
 from utils.log_util import LOGI
 from utils.cli_util import *
 
 
+def run_gui(args) -> None:
+    """
+    Build the Tk window and run the GUI until it is closed.
+    """
+    # Imported here so that headless runs never load tkinter
+    import tkinter as tk
+    from core.app import FunctionRunnerApp  # Absolute import
+
+    LOGI("Application configuration completed. Launching GUI...")
+
+    root = tk.Tk()
+    app = FunctionRunnerApp(
+        root,
+        run_mode=args.runmode,
+        max_workers=args.workers,
+        async_limit=args.asynclimit,
+        use_result_cache=args.resultcache,
+        timeout=args.timeout,
+    )
+    root.mainloop()
+
+
+def run_headless(args) -> int:
+    """
+    Run the selected functions without the GUI and return the exit code.
+    """
+    from core.headless import run_batch
+
+    LOGI("Application configuration completed. Running headless...")
+
+    return run_batch(
+        args.functions,
+        mode=args.runmode,
+        max_workers=args.parallel or args.workers,
+        async_limit=args.asynclimit,
+        summary_path=args.summary,
+        accounts_path=args.accounts,
+        chunk_size=args.chunk_size,
+        use_result_cache=args.resultcache,
+        invalidate=args.invalidate,
+        timeout=args.timeout,
+        queue_size=args.queue_size,
+    )
+
+
+def run_log_search(args) -> int:
+    """
+    Print the log records matching the filters; exit code 1 if there is none.
+    """
+    from utils.log_search import search_logs
+
+    found = 0
+    for record in search_logs(
+        args.file,
+        since=args.since,
+        until=args.until,
+        min_level=loglevel_s2i(args.min_level) if args.min_level else None,
+        account=args.account,
+        function=args.function,
+        limit=args.limit,
+        rebuild=args.reindex,
+    ):
+        sys.stdout.write(record + "\n")
+        found += 1
+    sys.stdout.flush()
+    return 0 if found else 1
+
+
+def run_bundle(args) -> int:
+    """
+    Build the zip bundle of the compiled function scripts at FUNCTIONS_BUNDLE.
+    """
+    from core.bytecode_cache import build_bundle
+
+    build_bundle()
+    return 0
+
+
 def main() -> None:
     """
     Main entry point for the Function Runner App.
@@ -18,18 +95,24 @@ def main() -> None:
     # Configure logging
     configure_logging(args)
 
-    LOGI("Application configuration completed. Launching GUI...")
-
+    exit_code = 0
     try:
-        root = tk.Tk()
-        app = FunctionRunnerApp(root)
-        root.mainloop()
+        if args.command == "run":
+            exit_code = run_headless(args)
+        elif args.command == "logs":
+            exit_code = run_log_search(args)
+        elif args.command == "bundle":
+            exit_code = run_bundle(args)
+        else:
+            run_gui(args)
     except Exception as e:
         LOGI(f"Application failed to start: {e}")
+        exit_code = 1
     finally:
         LOGI(
             "<====================================== Closing Function Runner App ======================================>"
         )
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""Benchmark of the function directory loader.
+
+Creates N empty function scripts in a temporary directory, saves their
+order (shuffled, with a few missing scripts and stale names) in a
+temporary state store, and times FileHandler.scan_function_files(). The
+old list-based reconciliation is timed too for the smaller sizes.
+
+Run from the project root:
+    python scripts/bench_loader.py [N ...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.file_handler import FileHandler
+from core.state_store import StateStore
+from utils.log_util import *
+
+# The list-based reconciliation takes minutes above this size
+LEGACY_MAX = 20000
+
+
+def legacy_order(functions_dir, saved_order):
+    """The previous loader: list membership checks, quadratic in the number of scripts."""
+    all_files = [f for f in os.listdir(functions_dir) if f.endswith(".py")]
+    ordered_files = [f for f in saved_order if f in all_files]
+    for f in all_files:
+        if f not in ordered_files:
+            ordered_files.append(f)
+    return ordered_files
+
+
+def bench(count):
+    """Time one directory of count scripts; return (scan seconds, legacy seconds or None)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        functions_dir = os.path.join(tmp, "functions")
+        os.makedirs(functions_dir)
+        names = [f"function_{i:06}.py" for i in range(count)]
+        for name in names:
+            open(os.path.join(functions_dir, name), "w").close()
+        # Saved order: shuffled, 1% not saved yet, plus names of deleted scripts
+        saved = names[: count - count // 100] + [f"deleted_{i}.py" for i in range(count // 100)]
+        random.shuffle(saved)
+        store = StateStore(os.path.join(tmp, "state.db"))
+        store.save_functions([(name, name, False) for name in saved])
+
+        start = time.perf_counter()
+        entries = FileHandler.scan_function_files(functions_dir, store.function_order())
+        scan_time = time.perf_counter() - start
+        assert len(entries) == count
+
+        legacy_time = None
+        if count <= LEGACY_MAX:
+            start = time.perf_counter()
+            legacy_order(functions_dir, store.function_order())
+            legacy_time = time.perf_counter() - start
+        store.close()
+    return scan_time, legacy_time
+
+
+def main():
+    set_log_level(WARN)
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000, 100000]
+    print(f"{'scripts':>10} {'scan s':>10} {'us/script':>10} {'legacy s':>10}")
+    for count in counts:
+        scan_time, legacy_time = bench(count)
+        legacy = f"{legacy_time:>10.3f}" if legacy_time is not None else f"{'-':>10}"
+        print(f"{count:>10} {scan_time:>10.3f} {scan_time / count * 1e6:>10.2f} {legacy}")
+
+
+if __name__ == "__main__":
+    main()
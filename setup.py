@@ -10,6 +10,9 @@ setup(
     install_requires=[
         # Add dependencies here if needed
     ],
+    extras_require={
+        "excel": ["openpyxl"],  # Read the account list from .xlsx files
+    },
     python_requires=">=3.7",
     entry_points={
         "console_scripts": [
@@ -0,0 +1,139 @@
+"""RateLimiter against a fake endpoint, driven by a fake clock.
+
+Run from the project root:
+    python -m unittest tests.test_rate_limiter
+"""
+
+import collections
+import unittest
+
+from core.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    """Clock whose sleep() only moves the time forward."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class FloodWait(Exception):
+    """Raised by FakeEndpoint when a window is over its limit, like a FLOOD_WAIT."""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"flood wait {seconds}s")
+        self.seconds = seconds
+
+
+class FakeEndpoint:
+    """Local stand-in for an API allowing limit calls per window seconds.
+
+    Calls are counted per fixed window, per account, or across accounts
+    when per_account is False. A call over the limit is rejected with
+    FloodWait until the window ends.
+    """
+
+    def __init__(self, clock: FakeClock, limit: int, window: float = 1.0, per_account=True):
+        self.clock = clock
+        self.limit = limit
+        self.window = window
+        self.per_account = per_account
+        self.calls = collections.Counter()
+        self.rejected = 0
+
+    def call(self, account=None) -> None:
+        now = self.clock.time()
+        window = int(now // self.window)
+        key = (account if self.per_account else None, window)
+        if self.calls[key] >= self.limit:
+            self.rejected += 1
+            raise FloodWait((window + 1) * self.window - now)
+        self.calls[key] += 1
+
+    def max_calls_per_window(self) -> int:
+        return max(self.calls.values(), default=0)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, limits) -> RateLimiter:
+        return RateLimiter(limits, clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_endpoint_rejects_unlimited_calls(self):
+        endpoint = FakeEndpoint(self.clock, limit=4)
+        with self.assertRaises(FloodWait):
+            for _ in range(5):
+                endpoint.call("a")
+
+    def test_per_account_rate(self):
+        # Rates with exact binary fractions keep the fake time exact
+        limiter = self.limiter({"send": {"rate": 4, "burst": 1}})
+        endpoint = FakeEndpoint(self.clock, limit=4)
+        for _ in range(40):
+            for account in ("a", "b"):
+                limiter.acquire("send", account)
+                endpoint.call(account)
+        self.assertEqual(endpoint.rejected, 0)
+        self.assertEqual(endpoint.max_calls_per_window(), 4)
+        self.assertEqual(self.clock.now, 9.75)
+
+    def test_burst_then_rate(self):
+        limiter = self.limiter({"send": {"rate": 2, "burst": 4}})
+        delays = [limiter.acquire("send", "a") for _ in range(6)]
+        self.assertEqual(delays, [0.0, 0.0, 0.0, 0.0, 0.5, 0.5])
+        self.assertEqual(limiter.stats()["waits"], 2)
+
+    def test_global_rate_across_accounts(self):
+        limiter = self.limiter({"send": {"rate": 100, "burst": 100, "global_rate": 4}})
+        endpoint = FakeEndpoint(self.clock, limit=4, per_account=False)
+        for i in range(30):
+            account = "abc"[i % 3]
+            limiter.acquire("send", account)
+            endpoint.call(account)
+        self.assertEqual(endpoint.rejected, 0)
+        self.assertEqual(endpoint.max_calls_per_window(), 4)
+
+    def test_penalize_after_flood_wait(self):
+        limiter = self.limiter({"send": {"rate": 8, "burst": 8}})
+        endpoint = FakeEndpoint(self.clock, limit=4)
+        retries = 0
+        for _ in range(12):
+            while True:
+                limiter.acquire("send", "a")
+                try:
+                    endpoint.call("a")
+                    break
+                except FloodWait as e:
+                    retries += 1
+                    limiter.penalize("send", "a", e.seconds)
+        # Each flood wait costs one rejected call, then the account waits it out
+        self.assertEqual(endpoint.rejected, retries)
+        self.assertLessEqual(retries, 3)
+        self.assertEqual(sum(endpoint.calls.values()), 12)
+
+    def test_penalize_global_only_operation(self):
+        limiter = self.limiter({"send": {"global_rate": 4}})
+        limiter.penalize("send", "a", 30)
+        self.assertEqual(limiter.reserve("send", "a"), 30.0)
+        self.assertGreater(limiter.reserve("send", "b"), 30.0)
+
+    def test_penalize_unlimited_operation(self):
+        limiter = self.limiter({"send": {}})
+        limiter.penalize("send", "a", 3)
+        self.assertEqual(limiter.reserve("send", "a"), 3.0)
+        self.assertEqual(limiter.reserve("send", "b"), 0.0)
+        # Once the penalty passed, the operation is unlimited again
+        self.clock.sleep(10)
+        self.assertEqual([limiter.reserve("send", "a") for _ in range(3)], [0.0] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 import sys
 import argparse
+from cfg.constants import FUNCTIONS_BUNDLE, LOG_FILE, RUN_MODES
+from utils.log_search import parse_time
 from utils.log_util import *
 
 
@@ -33,6 +35,167 @@ def parse_arguments() -> argparse.Namespace:
         default=None,
         help="Enable entry/exit log: 1, Yes, yes, Y, y, Enable, enable, True, true, T, t",
     )
+    parser.add_argument(
+        "-pf",
+        "--profile",
+        action="store_true",
+        help="Profile decorated calls; write a summary and flamegraph stacks at exit",
+    )
+    parser.add_argument(
+        "-nc",
+        "--noconsole",
+        action="store_true",
+        help="Do not print logs to the console, only write the log files",
+    )
+    parser.add_argument(
+        "-lj",
+        "--logjson",
+        action="store_true",
+        help="Also write logs as JSON Lines (level, account, function, duration)",
+    )
+    parser.add_argument(
+        "-rm",
+        "--runmode",
+        type=str,
+        default=None,
+        help="Run All execution mode: serial, thread, process, prefork",
+        choices=RUN_MODES,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of functions Run All executes concurrently",
+    )
+    parser.add_argument(
+        "-al",
+        "--asynclimit",
+        type=int,
+        default=None,
+        help="Maximum number of async functions Run All awaits concurrently",
+    )
+    parser.add_argument(
+        "-rc",
+        "--resultcache",
+        action="store_true",
+        help="Reuse cached results of functions that declare RESULT_TTL",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=None,
+        help="Fail a function run after this many seconds (scripts may set TIMEOUT)",
+    )
+
+    # Headless mode: "main run ..." executes functions without building the GUI
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser(
+        "run", help="Run functions headless and print a JSON summary"
+    )
+    run_parser.add_argument(
+        "-f",
+        "--functions",
+        type=lambda s: [name.strip() for name in s.split(",") if name.strip()],
+        default=None,
+        help="Comma-separated function names to run (default: all, in .order order)",
+    )
+    run_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=None,
+        help="Maximum number of functions executed concurrently",
+    )
+    run_parser.add_argument(
+        "-s",
+        "--summary",
+        type=str,
+        default="-",
+        help="Write the JSON summary to this file instead of stdout",
+    )
+    run_parser.add_argument(
+        "-a",
+        "--accounts",
+        type=str,
+        default=None,
+        help="Run every function for each account row of this Excel/CSV file",
+    )
+    run_parser.add_argument(
+        "-c",
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Number of accounts read and run at a time",
+    )
+    run_parser.add_argument(
+        "-q",
+        "--queue-size",
+        type=int,
+        default=None,
+        help="Maximum number of account runs queued or in flight at once",
+    )
+    run_parser.add_argument(
+        "--invalidate",
+        action="store_true",
+        help="Drop cached results of the selected functions before running",
+    )
+
+    # "main logs ..." searches the log file through its sidecar index
+    logs_parser = subparsers.add_parser(
+        "logs", help="Search the log file (indexed by time, level, function, account)"
+    )
+    logs_parser.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        default=LOG_FILE,
+        help="Log file to search: text log or .jsonl log",
+    )
+    logs_parser.add_argument(
+        "-a", "--account", type=str, default=None, help="Only records of this account"
+    )
+    logs_parser.add_argument(
+        "-fn",
+        "--function",
+        type=str,
+        default=None,
+        help="Only records of this function script or source function",
+    )
+    logs_parser.add_argument(
+        "-m",
+        "--min-level",
+        type=str,
+        default=None,
+        help="Minimum level: FATAL, ERROR, WARN, INFO, DEBUG, VERBOSE",
+        choices=["FATAL", "ERROR", "WARN", "INFO", "DEBUG", "VERBOSE"],
+    )
+    logs_parser.add_argument(
+        "--since",
+        type=parse_time,
+        default=None,
+        help="Earliest time: epoch seconds or YYYY-mm-dd[ HH:MM[:SS]]",
+    )
+    logs_parser.add_argument(
+        "--until",
+        type=parse_time,
+        default=None,
+        help="Latest time: epoch seconds or YYYY-mm-dd[ HH:MM[:SS]]",
+    )
+    logs_parser.add_argument(
+        "-n", "--limit", type=int, default=None, help="Maximum number of records"
+    )
+    logs_parser.add_argument(
+        "--reindex", action="store_true", help="Rebuild the index from scratch"
+    )
+
+    # "main bundle" compiles the functions directory into one zip archive
+    subparsers.add_parser(
+        "bundle",
+        help=f"Compile all function scripts into {FUNCTIONS_BUNDLE} for faster cold loads;"
+        " loads use it while scripts are unchanged",
+    )
 
     try:
         return parser.parse_args()
@@ -52,5 +215,11 @@ def configure_logging(args: argparse.Namespace) -> None:
     set_log_level(log_level)
     entry_log = entrylog_s2i(args.entrylog)
     set_entry_log(entry_log)
+    set_json_log(args.logjson)
+    set_console_log(not args.noconsole)
+    if args.command == "run":
+        # Keep stdout for the JSON summary, e.g. "main run ... | jq"
+        set_console_stream(sys.stderr)
+    set_profile(args.profile)
     LOGI(f"Logging configured with log level: {log_level}")
     LOGI(f"Entry/Exit logging configured: {'Enabled' if entry_log else 'Disabled'}")
@@ -0,0 +1,364 @@
+import bisect
+import json
+import mmap
+import os
+import re
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional
+from cfg.constants import LOG_INDEX_SUFFIX
+from utils.log_util import *
+
+
+# Index file layout: magic line, JSON header line, then the raw column arrays
+_MAGIC = b"LOGIDX1\n"
+
+# Record start of a text log line: timestamp, padded level name and the rest
+_TEXT_RECORD = re.compile(
+    rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) \[([A-Z]{5})\] ([^\n]*)$", re.M
+)
+_ACCOUNT_FIELD = re.compile(rb" account=(\S+)")
+_FUNCTION_FIELD = re.compile(rb" function=(\S+)")
+_LOCATION_FUNC = re.compile(rb" = ([^\s\]]+)\(\)\]$")
+
+# Padded level names of the text log
+_TEXT_LEVELS = {
+    b"FATAL": FATAL,
+    b"ERROR": ERROR,
+    b"WARNL": WARN,
+    b"INFOL": INFO,
+    b"DEBUG": DEBUG,
+    b"VERBO": VERBOSE,
+    b"EELOG": -1,
+}
+
+
+def parse_time(text: str) -> float:
+    """
+    Parse a query time: epoch seconds or a local "YYYY-mm-dd[ HH:MM[:SS]]" date.
+
+    Args:
+        text (str): Time given on the command line.
+
+    Returns:
+        float: Epoch seconds.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time: {text}")
+
+
+class LogIndex:
+    """
+    Sidecar index of a log file for filtered searches without rescanning it.
+
+    For every record the index keeps its byte offset, timestamp, level,
+    function and account, as compact column arrays, plus the records of
+    each account and of WARN and above. It is saved next to the log
+    (LOG_INDEX_SUFFIX) and extended incrementally when the log grows.
+    Text logs and JSON Lines logs (--logjson) are supported.
+    """
+
+    def __init__(self, log_path: str, index_path: Optional[str] = None):
+        self.log_path = log_path
+        self.index_path = index_path or log_path + LOG_INDEX_SUFFIX
+        self.is_json = log_path.endswith(".jsonl")
+        self._reset()
+
+    def _reset(self) -> None:
+        """
+        Start an empty index.
+        """
+        self.size = 0
+        self.log_id: List[int] = []
+        self.offsets = array("Q")
+        self.times = array("d")
+        self.levels = array("b")
+        self.functions = array("I")
+        self.accounts = array("I")
+        # Id 0 stands for "none" in the function and account columns
+        self.function_names: List[str] = [""]
+        self.account_names: List[str] = [""]
+        self.account_rows: Dict[int, array] = {}
+        self.alert_rows = array("I")
+        self.is_sorted = True
+        self._function_ids = {"": 0}
+        self._account_ids = {"": 0}
+
+    @log_entry_exit
+    def load(self) -> bool:
+        """
+        Load the saved index; return False if there is none or it is unreadable.
+        """
+        try:
+            with open(self.index_path, "rb") as f:
+                if f.readline() != _MAGIC:
+                    return False
+                header = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            return False
+        self._reset()
+        self.size = header["size"]
+        self.log_id = header["log_id"]
+        self.is_sorted = header["sorted"]
+        self.function_names = header["functions"]
+        self.account_names = header["accounts"]
+        self._function_ids = {name: i for i, name in enumerate(self.function_names)}
+        self._account_ids = {name: i for i, name in enumerate(self.account_names)}
+        pos = 0
+        for column in (self.offsets, self.times, self.levels, self.functions, self.accounts):
+            length = header["count"] * column.itemsize
+            column.frombytes(data[pos : pos + length])
+            pos += length
+        length = header["alerts"] * self.alert_rows.itemsize
+        self.alert_rows.frombytes(data[pos : pos + length])
+        pos += length
+        for account, count in header["account_rows"]:
+            rows = array("I")
+            rows.frombytes(data[pos : pos + count * rows.itemsize])
+            pos += count * rows.itemsize
+            self.account_rows[account] = rows
+        return True
+
+    @log_entry_exit
+    def save(self) -> None:
+        """
+        Write the index next to the log (atomic replace).
+        """
+        header = {
+            "size": self.size,
+            "log_id": self.log_id,
+            "count": len(self.offsets),
+            "sorted": self.is_sorted,
+            "functions": self.function_names,
+            "accounts": self.account_names,
+            "alerts": len(self.alert_rows),
+            "account_rows": [[a, len(rows)] for a, rows in self.account_rows.items()],
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for column in (self.offsets, self.times, self.levels, self.functions, self.accounts):
+                f.write(column.tobytes())
+            f.write(self.alert_rows.tobytes())
+            for rows in self.account_rows.values():
+                f.write(rows.tobytes())
+        os.replace(tmp_path, self.index_path)
+
+    @log_entry_exit
+    def update(self, rebuild: bool = False) -> int:
+        """
+        Index the records appended since the last update and save the index.
+
+        The index is rebuilt when asked to, or when the log was replaced or
+        truncated (e.g. rotated) since it was built.
+
+        Args:
+            rebuild (bool): Ignore the saved index.
+
+        Returns:
+            int: Number of records added.
+        """
+        stat = os.stat(self.log_path)
+        log_id = [stat.st_dev, stat.st_ino]
+        if rebuild or not self.load() or self.log_id != log_id or stat.st_size < self.size:
+            self._reset()
+            self.log_id = log_id
+        if stat.st_size == self.size:
+            return 0
+        before = len(self.offsets)
+        with open(self.log_path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            # Only complete lines; a line still being written is indexed next time
+            end = mm.rfind(b"\n", self.size) + 1
+            if end > self.size:
+                if self.is_json:
+                    self._scan_json(mm, self.size, end)
+                else:
+                    self._scan_text(mm, self.size, end)
+                self.size = end
+        self.save()
+        added = len(self.offsets) - before
+        LOGI(f"Indexed {added} new log record(s) of {self.log_path}")
+        return added
+
+    def _add(self, offset: int, created: float, level: int, function, account) -> None:
+        """
+        Append one record to the columns and postings.
+        """
+        row = len(self.offsets)
+        if self.times and created < self.times[-1]:
+            self.is_sorted = False
+        self.offsets.append(offset)
+        self.times.append(created)
+        self.levels.append(level)
+        self.functions.append(self._intern(function, self._function_ids, self.function_names))
+        account_id = self._intern(account, self._account_ids, self.account_names)
+        self.accounts.append(account_id)
+        if account_id:
+            rows = self.account_rows.get(account_id)
+            if rows is None:
+                rows = self.account_rows[account_id] = array("I")
+            rows.append(row)
+        if level >= WARN:
+            self.alert_rows.append(row)
+
+    @staticmethod
+    def _intern(value, ids: Dict[str, int], names: List[str]) -> int:
+        """
+        Return the id of a function or account name, adding it if new.
+        """
+        if not value:
+            return 0
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", "replace")
+        value = str(value)
+        idx = ids.get(value)
+        if idx is None:
+            idx = ids[value] = len(names)
+            names.append(value)
+        return idx
+
+    def _scan_text(self, mm: mmap.mmap, start: int, end: int) -> None:
+        """
+        Index the text log records between two offsets.
+        """
+        seconds: Dict[bytes, float] = {}
+        for match in _TEXT_RECORD.finditer(mm, start, end):
+            stamp, millis, level_name, rest = match.groups()
+            second = seconds.get(stamp)
+            if second is None:
+                second = seconds[stamp] = time.mktime(
+                    time.strptime(stamp.decode("ascii"), "%Y-%m-%d %H:%M:%S")
+                )
+            account = _ACCOUNT_FIELD.search(rest)
+            function = _FUNCTION_FIELD.search(rest) or _LOCATION_FUNC.search(rest)
+            self._add(
+                match.start(),
+                second + int(millis) / 1000,
+                _TEXT_LEVELS.get(level_name, 0),
+                function.group(1) if function else None,
+                account.group(1) if account else None,
+            )
+
+    def _scan_json(self, mm: mmap.mmap, start: int, end: int) -> None:
+        """
+        Index the JSON Lines records between two offsets.
+        """
+        pos = start
+        while pos < end:
+            line_end = mm.find(b"\n", pos, end)
+            try:
+                record = json.loads(mm[pos:line_end])
+                self._add(
+                    pos,
+                    float(record.get("time", 0)),
+                    loglevel_s2i(record.get("level")),
+                    record.get("function") or record.get("func"),
+                    record.get("account"),
+                )
+            except ValueError:
+                LOGD(f"Skipping unreadable JSON log line at offset {pos}")
+            pos = line_end + 1
+
+    def query(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        min_level: Optional[int] = None,
+        account: Optional[str] = None,
+        function: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[str]:
+        """
+        Yield the matching records (with their continuation lines) in log order.
+
+        Args:
+            since (float): Earliest epoch time.
+            until (float): Latest epoch time.
+            min_level (int): Lowest level, e.g. ERROR.
+            account (str): Account id.
+            function (str): Function script or source function name.
+            limit (int): Maximum number of records.
+
+        Returns:
+            Iterator[str]: Matching log records.
+        """
+        rows = self._candidate_rows(since, until, min_level, account, function)
+        if rows is None:
+            return
+        function_id = self._function_ids.get(function) if function else None
+        found = 0
+        with open(self.log_path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            for row in rows:
+                if since is not None and self.times[row] < since:
+                    continue
+                if until is not None and self.times[row] > until:
+                    continue
+                if min_level is not None and self.levels[row] < min_level:
+                    continue
+                if function_id is not None and self.functions[row] != function_id:
+                    continue
+                end = self.offsets[row + 1] if row + 1 < len(self.offsets) else self.size
+                yield mm[self.offsets[row] : end].decode("utf-8", "replace").rstrip("\n")
+                found += 1
+                if limit and found >= limit:
+                    return
+
+    def _candidate_rows(self, since, until, min_level, account, function):
+        """
+        Return the rows worth checking, from the most selective posting list, or None if none match.
+        """
+        if function and function not in self._function_ids:
+            return None
+        if account is not None:
+            account_id = self._account_ids.get(str(account))
+            return self.account_rows.get(account_id) if account_id else None
+        if min_level is not None and min_level >= WARN:
+            return self.alert_rows
+        lo, hi = 0, len(self.offsets)
+        if self.is_sorted:
+            # Seek straight to the time range
+            if since is not None:
+                lo = bisect.bisect_left(self.times, since)
+            if until is not None:
+                hi = bisect.bisect_right(self.times, until)
+        return range(lo, hi)
+
+
+@log_entry_exit
+def search_logs(
+    log_path: str,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    min_level: Optional[int] = None,
+    account: Optional[str] = None,
+    function: Optional[str] = None,
+    limit: Optional[int] = None,
+    rebuild: bool = False,
+) -> Iterator[str]:
+    """
+    Bring the index of a log file up to date and yield the matching records.
+
+    Args:
+        log_path (str): Text log or JSON Lines log file.
+        rebuild (bool): Rebuild the index from scratch.
+
+    Returns:
+        Iterator[str]: Matching log records.
+    """
+    index = LogIndex(log_path)
+    index.update(rebuild=rebuild)
+    return index.query(since, until, min_level, account, function, limit)
@@ -1,27 +1,79 @@
+import asyncio
+import atexit
+import contextlib
+import contextvars
 import functools
+import glob
+import gzip
+import inspect
+import itertools
+import json
 import logging
-import datetime
+import multiprocessing
 import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
 
 
-from cfg.constants import LOG_FILE
+from cfg.constants import (
+    LOG_BACKUP_COUNT,
+    LOG_BATCH_SIZE,
+    LOG_CONSOLE,
+    LOG_CONSOLE_BUFFER_SIZE,
+    LOG_CONSOLE_FLUSH_INTERVAL,
+    LOG_FILE,
+    LOG_JSON_FILE,
+    LOG_MAX_BYTES,
+    LOG_QUEUE_OVERFLOW,
+    LOG_QUEUE_SIZE,
+    LOG_REPEAT_FLUSH_INTERVAL,
+    LOG_ROTATE_INTERVAL,
+    LOG_SITE_RATE_LIMIT,
+    PROFILE_MAX_SAMPLES,
+    PROFILE_OUTPUT,
+)
+from utils.profiler import CallProfiler
 
 
 # Define public API
 __all__ = [
     "set_entry_log",
+    "set_json_log",
+    "set_console_log",
+    "set_console_stream",
+    "get_log_settings",
+    "apply_log_settings",
+    "set_profile",
+    "write_profile",
+    "trace_context",
+    "get_correlation_id",
     "log_entry_exit",
     "set_log_level",
     "get_log_level",
     "get_level_name",
     "loglevel_s2i",
     "entrylog_s2i",
+    "is_log_enabled",
+    "Lazy",
+    "flush_logs",
+    "shutdown_logging",
     "LOGF",
     "LOGE",
     "LOGW",
     "LOGI",
     "LOGD",
     "LOGV",
+    "FATAL",
+    "ERROR",
+    "WARN",
+    "INFO",
+    "DEBUG",
+    "VERBOSE",
 ]
 
 
@@ -41,17 +93,488 @@ ENTRY_EXIT = -1
 # Private global configuration (only for this file)
 _gLogLevel = INFO
 _gEntryExitLog = False
-_gCallDepth = 0
+_gJsonLog = False
+_gProfile = False
+# Sampling and rate limit state per call site: (filename, lineno) -> counters
+_gLogSites = {}
+# Trace context of the current thread/task: (depth, span id, correlation id, account)
+_gTraceContext = contextvars.ContextVar("trace_context", default=None)
+_gSpanIds = itertools.count(1)
+_gPid = os.getpid()
+_gTracedFunctions = []
+_gWrappersInstalled = False
+_gProfiler = CallProfiler(PROFILE_MAX_SAMPLES)
+
+
+class _RotatingFile:
+    """Append-only log file rotated by size or age, old segments gzipped in the background.
+
+    A full file is renamed to "<path>.<timestamp>-<n>" and compressed to
+    "<path>.<timestamp>-<n>.gz" by a helper thread; only the newest
+    backup_count segments are kept.
+
+    Worker processes append to the same file, so only the main process
+    rotates it, judging by the size of the file rather than of its own
+    writes, and every process reopens the path once it was rotated away
+    instead of writing into a segment that is being compressed.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=LOG_MAX_BYTES,
+        interval=LOG_ROTATE_INTERVAL,
+        backup_count=LOG_BACKUP_COUNT,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self._file = None
+        self._inode = None
+        self._opened = 0.0
+        self._compressors = []
+        self._can_rotate = multiprocessing.parent_process() is None
+
+    def write(self, text):
+        """Append text, rotating first if the file is full or too old."""
+        if self._file is None or self._moved():
+            self._close_file()
+            self._open()
+        elif self._can_rotate and (
+            (self.max_bytes and os.fstat(self._file.fileno()).st_size >= self.max_bytes)
+            or (self.interval and time.time() - self._opened >= self.interval)
+        ):
+            self._rotate()
+        self._file.write(text)
+        self._file.flush()
+
+    def _moved(self):
+        """Return True if another process rotated the file away since it was opened."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_dev, stat.st_ino) != self._inode
+
+    def _open(self):
+        """Open the current file for appending."""
+        self._file = open(self.path, "a", encoding="utf-8")
+        stat = os.fstat(self._file.fileno())
+        self._inode = (stat.st_dev, stat.st_ino)
+        self._opened = time.time()
+
+    def _close_file(self):
+        """Close the open file, if any."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        """Move the current file aside, compress it in the background and start a new one."""
+        self._file.close()
+        # Names sort by age: timestamp plus a counter for rotations within a second
+        stamp = self.path + time.strftime(".%Y%m%d-%H%M%S")
+        suffix = 0
+        segment = f"{stamp}-{suffix:03d}"
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            suffix += 1
+            segment = f"{stamp}-{suffix:03d}"
+        os.replace(self.path, segment)
+        self._open()
+        self._compressors = [t for t in self._compressors if t.is_alive()]
+        thread = threading.Thread(
+            target=self._compress, args=(segment,), name="log_compress", daemon=True
+        )
+        thread.start()
+        self._compressors.append(thread)
+
+    def _compress(self, segment):
+        """Gzip a rotated segment, then drop segments beyond backup_count."""
+        try:
+            with open(segment, "rb") as src, gzip.open(segment + ".gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(segment + ".gz.tmp", segment + ".gz")
+            os.remove(segment)
+            segments = sorted(glob.glob(glob.escape(self.path) + ".*.gz"))
+            for old in segments[: max(0, len(segments) - self.backup_count)]:
+                os.remove(old)
+        except OSError as e:
+            sys.stderr.write(f"Cannot compress log segment {segment}: {e!r}\n")
+
+    def close(self):
+        """Close the file and wait for pending compressions."""
+        self._close_file()
+        for thread in self._compressors:
+            thread.join()
+        self._compressors = []
+
+
+# ANSI color sequences, stripped when the console is not a terminal
+_ANSI_ESCAPE = re.compile(r"\033\[[0-9;]*m")
+
+
+class _ConsoleSink:
+    """Buffered console output of the log writer.
+
+    Output goes to stdout, or to stderr after set_console_stream(sys.stderr).
+    On a terminal every batch is shown right away. When the stream is a
+    pipe or a file, colors are stripped and output is flushed once
+    LOG_CONSOLE_BUFFER_SIZE characters are buffered, every
+    LOG_CONSOLE_FLUSH_INTERVAL seconds, or at once for errors.
+    """
+
+    def __init__(
+        self,
+        enabled=LOG_CONSOLE,
+        buffer_size=LOG_CONSOLE_BUFFER_SIZE,
+        interval=LOG_CONSOLE_FLUSH_INTERVAL,
+    ):
+        self.enabled = enabled
+        # None: sys.stdout at the time of writing
+        self.stream = None
+        self.buffer_size = buffer_size
+        self.interval = interval
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, lines, urgent=False):
+        """Buffer console lines, flushing when due."""
+        if not self.enabled or not lines:
+            return
+        stream = self._stream()
+        if stream is None:
+            # No console at all, e.g. a windowed app
+            return
+        tty = _is_tty(stream)
+        text = "\n".join(lines) + "\n"
+        if not tty:
+            text = _ANSI_ESCAPE.sub("", text)
+        with self._lock:
+            self._parts.append(text)
+            self._size += len(text)
+            if (
+                tty
+                or urgent
+                or self._size >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.interval
+            ):
+                self._flush(stream)
+
+    def flush(self):
+        """Write out the buffered output."""
+        with self._lock:
+            self._flush(self._stream())
+
+    def _stream(self):
+        """Return the stream console output goes to."""
+        return sys.stdout if self.stream is None else self.stream
+
+    def _flush(self, stream):
+        """Write the buffer to stream; the caller holds the lock."""
+        self._last_flush = time.monotonic()
+        if not self._parts:
+            return
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        if stream is not None:
+            stream.write(text)
+            stream.flush()
+
+
+def _is_tty(stream):
+    """Return True if stream is an interactive terminal."""
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class _LogWriter:
+    """Background thread writing queued log records to the console and the log file.
+
+    Log calls only format their message and enqueue it; the writer takes
+    up to LOG_BATCH_SIZE records at a time and writes each output once per
+    batch. When the bounded queue is full, LOG_QUEUE_OVERFLOW decides:
+    "block" waits, "drop" drops the new record and "drop_low" drops it
+    only below WARN. Dropped records are counted and reported.
+    Consecutive identical messages are written once, followed by
+    "last message repeated N times" when another message arrives or the
+    queue stays idle for LOG_REPEAT_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, path, max_size=LOG_QUEUE_SIZE, overflow=LOG_QUEUE_OVERFLOW):
+        self.path = path
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._file = _RotatingFile(path)
+        self._json_file = None
+        self._console = _ConsoleSink()
+        self._closed = False
+        # Orders put() against close(), and serializes the inline writes after close
+        self._lock = threading.Lock()
+        self._last_key = None
+        self._last_record = None
+        self._repeats = 0
+        self._thread = threading.Thread(target=self._run, name="log_writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Queue a (created, level, console text, file text, location, fields) record."""
+        with self._lock:
+            if self._closed:
+                # The writer thread is gone; write in the caller, one at a time
+                self._write([record])
+                return
+            if self.overflow == "block" or (
+                self.overflow == "drop_low" and record[1] >= WARN
+            ):
+                # The writer thread never takes the lock, so it keeps draining
+                self._queue.put(record)
+                return
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        """Write records batch by batch until the None sentinel is received."""
+        while True:
+            try:
+                batch = [
+                    self._queue.get(
+                        timeout=min(LOG_REPEAT_FLUSH_INTERVAL, LOG_CONSOLE_FLUSH_INTERVAL)
+                    )
+                ]
+            except queue.Empty:
+                if self._repeats:
+                    self._write([])
+                self._console.flush()
+                continue
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write(
+                    [record for record in batch if record is not None],
+                    flush_repeats=stop,
+                )
+            except Exception as e:
+                sys.stderr.write(f"Log writer failed: {e!r}\n")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _collapse(self, records, flush_repeats):
+        """Drop repeats of the previous message, adding "last message repeated" summaries.
+
+        A repeat must also have the same fields, so the records of different
+        accounts or functions are kept and stay searchable.
+        """
+        collapsed = []
+        for record in records:
+            key = (record[1], record[2], record[3], record[5])
+            if key == self._last_key:
+                self._repeats += 1
+                continue
+            self._add_repeat_summary(collapsed)
+            self._last_key = key
+            self._last_record = record
+            collapsed.append(record)
+        if flush_repeats or not records:
+            self._add_repeat_summary(collapsed)
+        return collapsed
+
+    def _add_repeat_summary(self, records):
+        """Append the summary of the pending repeats, if any."""
+        if not self._repeats:
+            return
+        level, console, text, _ = self._last_key
+        message = f"[{get_level_name(level)}] last message repeated {self._repeats} time(s)"
+        records.append(
+            (
+                time.time(),
+                level,
+                message if console is not None else None,
+                message if text is not None else None,
+                self._last_record[4],
+                self._last_record[5],
+            )
+        )
+        self._repeats = 0
+        # The next occurrence is written in full again
+        self._last_key = None
+
+    def _write(self, records, flush_repeats=True):
+        """Write a batch of records with one console and one file write."""
+        records = self._collapse(records, flush_repeats)
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            message = f"[{get_level_name(WARN)}] Log queue full, dropped {dropped} message(s)"
+            records.append((time.time(), WARN, message, message, None, None))
+        console_lines = [r[2] for r in records if r[2] is not None]
+        file_records = [r for r in records if r[3] is not None]
+        self._console.write(
+            console_lines,
+            urgent=self._closed or any(r[1] >= ERROR for r in records),
+        )
+        if file_records:
+            self._file.write(
+                "\n".join(_format_file_line(r) for r in file_records) + "\n"
+            )
+            if _gJsonLog:
+                if self._json_file is None:
+                    self._json_file = _RotatingFile(LOG_JSON_FILE)
+                self._json_file.write(
+                    "\n".join(_format_json_line(r) for r in file_records) + "\n"
+                )
 
+    def flush(self):
+        """Block until every record queued so far is written."""
+        if not self._closed:
+            self._queue.join()
+        self._console.flush()
 
-# Setup basic file logging
+    def close(self):
+        """Write the queued records and stop the thread; later records are written inline."""
+        with self._lock:
+            if self._closed:
+                return
+            # Closed before the sentinel, so no record is queued behind it
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            self._console.flush()
+            self._file.close()
+            if self._json_file is not None:
+                self._json_file.close()
+
+
+# Fields appended to text log lines, with their labels
+_FILE_LINE_FIELDS = (("account", "account"), ("function", "function"), ("correlation", "corr"))
+
+
+def _format_file_line(record):
+    """Format a record like "%(asctime)s %(message)s [%(filename)s:%(lineno)d = %(funcName)s()]".
+
+    Account, function and correlation fields are appended as
+    "account=<id> function=<name> corr=<id>" so the log search index can pick them up.
+    """
+    created, _, _, message, location, fields = record
+    asctime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+    line = f"{asctime},{int(created % 1 * 1000):03d} {message}"
+    if fields:
+        for name, label in _FILE_LINE_FIELDS:
+            if fields.get(name) is not None:
+                line += f" {label}={fields[name]}"
+    if location is not None:
+        filename, lineno, func_name = location
+        line += f" [{os.path.basename(filename)}:{lineno} = {func_name}()]"
+    return line
+
+
+# Unpadded level names for the JSON log
+_JSON_LEVEL_NAMES = {
+    FATAL: "FATAL",
+    ERROR: "ERROR",
+    WARN: "WARN",
+    INFO: "INFO",
+    DEBUG: "DEBUG",
+    VERBOSE: "VERBOSE",
+    ENTRY_EXIT: "ENTRY_EXIT",
+}
+
+
+def _format_json_line(record):
+    """Format a record as one JSON object with level, message, location and extra fields."""
+    created, level, _, message, location, fields = record
+    if message.startswith("["):
+        # Drop the "[LEVEL] " prefix, the level has its own field
+        message = message.partition("] ")[2] or message
+    data = {
+        "time": round(created, 6),
+        "level": _JSON_LEVEL_NAMES.get(level, "NOTSET"),
+        "message": message,
+    }
+    if location is not None:
+        data["file"] = os.path.basename(location[0])
+        data["line"] = location[1]
+        data["func"] = location[2]
+    if fields:
+        data.update(fields)
+    return json.dumps(data, default=str, ensure_ascii=False)
+
+
+def _caller_location(depth):
+    """Return (filename, lineno, function name) of the frame depth levels up."""
+    try:
+        frame = sys._getframe(depth + 1)
+    except ValueError:
+        return None
+    return frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name
+
+
+class _ForwardHandler(logging.Handler):
+    """Route records of the logging module (e.g. from libraries) to the log file."""
+
+    def emit(self, record):
+        try:
+            _gLogWriter.put(
+                (
+                    record.created,
+                    record.levelno,
+                    None,
+                    record.getMessage(),
+                    (record.pathname, record.lineno, record.funcName),
+                    None,
+                )
+            )
+        except Exception:
+            self.handleError(record)
+
+
+# Setup the queued file logging
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=DEBUG,
-    format="%(asctime)s %(message)s [%(filename)s:%(lineno)d = %(funcName)s()]",
-    encoding="utf-8",
-)
+_gLogWriter = _LogWriter(LOG_FILE)
+logging.basicConfig(level=DEBUG, handlers=[_ForwardHandler()])
+
+
+def flush_logs():
+    """
+    Wait until all queued log messages are written.
+    """
+    _gLogWriter.flush()
+
+
+def shutdown_logging():
+    """
+    Write the queued log messages and stop the log writer thread.
+    """
+    _report_suppressed()
+    _gLogWriter.close()
+
+
+def _reset_after_fork():
+    """The writer thread does not survive fork(); start a new one in the child."""
+    global _gLogWriter, _gPid
+    _gLogWriter = _LogWriter(LOG_FILE)
+    _gPid = os.getpid()
+
+
+atexit.register(shutdown_logging)
+# Registered after shutdown_logging, so it runs first and can still log
+atexit.register(lambda: _gProfile and write_profile())
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def set_log_level(level):
@@ -62,6 +585,13 @@ def set_log_level(level):
     _gLogLevel = level
 
 
+def is_log_enabled(level):
+    """
+    Return True if messages of this level are emitted; guard expensive log arguments with it.
+    """
+    return level >= _gLogLevel
+
+
 def get_log_level():
     """
     Get the global minimum log level.
@@ -118,12 +648,101 @@ def loglevel_s2i(level_str):
         return INFO  # Default if invalid
 
 
+def set_console_log(enable: bool):
+    """
+    Enable or disable console output; when disabled, logs only go to the log files.
+    """
+    _gLogWriter._console.flush()
+    _gLogWriter._console.enabled = bool(enable)
+
+
+def set_console_stream(stream):
+    """
+    Send console output to stream (e.g. sys.stderr) instead of stdout.
+    """
+    _gLogWriter._console.flush()
+    _gLogWriter._console.stream = stream
+
+
+def set_json_log(enable: bool):
+    """
+    Enable or disable the JSON Lines log file (LOG_JSON_FILE) next to the text log.
+    """
+    global _gJsonLog
+    _gJsonLog = bool(enable)
+
+
 def set_entry_log(enable: bool):
     """
     Enable or disable entry-exit logging.
+    Decorated functions are swapped between their traced and plain versions.
     """
     global _gEntryExitLog
-    _gEntryExitLog = enable
+    _gEntryExitLog = bool(enable)
+    _install_wrappers()
+
+
+def set_profile(enable: bool):
+    """
+    Enable or disable profiling of the functions decorated with log_entry_exit.
+    The report is written by write_profile(), and at exit while profiling is on.
+    """
+    global _gProfile
+    _gProfile = bool(enable)
+    _install_wrappers()
+
+
+def get_log_settings():
+    """
+    Return the log settings as a picklable dict, for apply_log_settings() in worker processes.
+    """
+    return {
+        "level": _gLogLevel,
+        "entry_log": _gEntryExitLog,
+        "json_log": _gJsonLog,
+        "console": _gLogWriter._console.enabled,
+        "console_stderr": _gLogWriter._console.stream is sys.stderr,
+    }
+
+
+def apply_log_settings(settings):
+    """
+    Apply settings from get_log_settings(); spawned worker processes call it
+    at startup since they import this module with the defaults.
+    """
+    set_log_level(settings["level"])
+    set_entry_log(settings["entry_log"])
+    set_json_log(settings["json_log"])
+    set_console_log(settings["console"])
+    if settings["console_stderr"]:
+        set_console_stream(sys.stderr)
+
+
+def write_profile(prefix=PROFILE_OUTPUT):
+    """
+    Write the profile summary table and call tree (<prefix>.txt) and the
+    collapsed stacks for flamegraph tools (<prefix>.collapsed), and log the table.
+    """
+    paths = _gProfiler.write_reports(prefix)
+    log("Profile summary:\n" + _gProfiler.format_summary(), level=INFO)
+    log(f"Wrote profile to {', '.join(paths)}", level=INFO)
+    return paths
+
+
+def _install_wrappers():
+    """
+    Install the wrappers while entry-exit logging or profiling is on, else the plain functions.
+    """
+    global _gWrappersInstalled
+    install = _gEntryExitLog or _gProfile
+    if install == _gWrappersInstalled:
+        return
+    _gWrappersInstalled = install
+    for func, wrapper in _gTracedFunctions:
+        if install:
+            _rebind(func, func, wrapper)
+        else:
+            _rebind(func, wrapper, func)
 
 
 def entrylog_s2i(entrylog_str):
@@ -148,62 +767,207 @@ def entrylog_s2i(entrylog_str):
         return False
 
 
-def log(*args, level=INFO):
+class Lazy:
+    """
+    Log argument formatted only when the message is emitted.
+    Lazy(callable, *args) logs callable(*args); Lazy("fmt %s", *args) logs "fmt %s" % args.
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        if callable(self.func):
+            return str(self.func(*self.args))
+        return self.func % self.args if self.args else str(self.func)
+
+
+def log(*args, level=INFO, **fields):
     """
     General log function: outputs to both console and file if level is sufficient.
     This function can now handle any number of arguments.
+    Keyword arguments (e.g. account, function, duration) become fields of the JSON log,
+    except sample=N (log 1 of every N calls from this line) and rate=R (at most R
+    messages per second from this line, LOG_SITE_RATE_LIMIT by default).
+    WARN and more severe messages are never sampled or rate limited.
     """
     if level >= _gLogLevel:
-        time_stamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        location = _caller_location(2)
+        sample = fields.pop("sample", None)
+        rate = fields.pop("rate", None)
+        suppressed = 0
+        if level < WARN and location is not None:
+            # Warnings and errors are never sampled or rate limited
+            suppressed = _throttle(location, sample, rate)
+            if suppressed is None:
+                return
         level_name = get_level_name(level)
 
         # Convert all arguments to strings, ensuring that even complex types are captured
         message = " ".join([str(arg) for arg in args])
+        if suppressed:
+            message += f" ({suppressed} more from this line suppressed)"
 
         formatted_message = f"[{level_name}] {message}"
 
-        # Print to console
-        print(formatted_message)
+        # Tag the record with the run it belongs to; explicit fields take precedence
+        fields = {**_context_fields(), **fields}
+
+        # Queue for the console and the file; the writer thread does the I/O
+        _gLogWriter.put(
+            (
+                time.time(),
+                level,
+                formatted_message,
+                formatted_message,
+                location,
+                fields,
+            )
+        )
+
+
+def _throttle(location, sample, rate):
+    """
+    Apply sampling (log 1 of every sample calls) and the per-second rate limit
+    to a call site. Returns None to skip the message, else how many messages
+    of the site the rate limit suppressed since the last one written.
+    """
+    site = location[:2]
+    state = _gLogSites.get(site)
+    if state is None:
+        # [calls, window start, written in window, suppressed]
+        state = _gLogSites[site] = [0, 0.0, 0, 0]
+    state[0] += 1
+    if sample and sample > 1 and (state[0] - 1) % sample:
+        return None
+    limit = LOG_SITE_RATE_LIMIT if rate is None else rate
+    if limit:
+        now = time.monotonic()
+        if now - state[1] >= 1.0:
+            state[1] = now
+            state[2] = 0
+        if state[2] >= limit:
+            state[3] += 1
+            return None
+        state[2] += 1
+    suppressed, state[3] = state[3], 0
+    return suppressed
+
 
-        # Log to file
-        logging.log(logging.INFO, formatted_message, stacklevel=3)
+def _report_suppressed():
+    """
+    Log how many messages each call site had suppressed when the rate limit window closed.
+    """
+    for (filename, lineno), state in list(_gLogSites.items()):
+        if state[3]:
+            _gLogWriter.put(
+                (
+                    time.time(),
+                    WARN,
+                    None,
+                    f"[{get_level_name(WARN)}] {state[3]} message(s) from "
+                    f"{os.path.basename(filename)}:{lineno} suppressed by the rate limit",
+                    None,
+                    None,
+                )
+            )
+            state[3] = 0
 
 
-def logee(message, level=ENTRY_EXIT):
+def logee(message, level=ENTRY_EXIT, console_message=None, fields=None, stacklevel=2):
     """
     Log function for Entry-Exit log only.
     """
-    time_stamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     level_name = get_level_name(level)
     formatted_message = f"[{level_name}] {message}"
 
-    # Log to file
-    logging.log(logging.INFO, formatted_message, stacklevel=5)
+    # Queue for the file, and for the console if a colored message is given
+    _gLogWriter.put(
+        (
+            time.time(),
+            level,
+            console_message,
+            formatted_message,
+            _caller_location(stacklevel),
+            fields,
+        )
+    )
+
+
+@contextlib.contextmanager
+def trace_context(correlation_id=None, account=None):
+    """
+    Run a block (e.g. one account run) under a correlation id shared by its traces and logs.
+    A new id is generated if none is given. Every record logged inside the block carries
+    the correlation id, and the account if one is given (else the enclosing one). The
+    context follows the current thread or asyncio task, so concurrent runs do not mix.
+    """
+    current = _gTraceContext.get()
+    depth, span_id, _, outer_account = current or (0, None, None, None)
+    correlation_id = correlation_id or uuid.uuid4().hex[:16]
+    account = outer_account if account is None else account
+    token = _gTraceContext.set((depth, span_id, correlation_id, account))
+    try:
+        yield correlation_id
+    finally:
+        _gTraceContext.reset(token)
+
+
+def get_correlation_id():
+    """
+    Return the correlation id of the current trace context, or None.
+    """
+    current = _gTraceContext.get()
+    return current[2] if current else None
+
+
+def _context_fields():
+    """
+    Return the correlation and account fields of the current trace context.
+    """
+    current = _gTraceContext.get()
+    if current is None:
+        return {}
+    fields = {}
+    if current[2] is not None:
+        fields["correlation"] = current[2]
+    if current[3] is not None:
+        fields["account"] = current[3]
+    return fields
 
 
 # Predefined short log functions for each level
-def LOGF(*args):
-    log(*args, level=FATAL)
+def LOGF(*args, **fields):
+    if FATAL >= _gLogLevel:
+        log(*args, level=FATAL, **fields)
 
 
-def LOGE(*args):
-    log(*args, level=ERROR)
+def LOGE(*args, **fields):
+    if ERROR >= _gLogLevel:
+        log(*args, level=ERROR, **fields)
 
 
-def LOGW(*args):
-    log(*args, level=WARN)
+def LOGW(*args, **fields):
+    if WARN >= _gLogLevel:
+        log(*args, level=WARN, **fields)
 
 
-def LOGI(*args):
-    log(*args, level=INFO)
+def LOGI(*args, **fields):
+    if INFO >= _gLogLevel:
+        log(*args, level=INFO, **fields)
 
 
-def LOGD(*args):
-    log(*args, level=DEBUG)
+def LOGD(*args, **fields):
+    if DEBUG >= _gLogLevel:
+        log(*args, level=DEBUG, **fields)
 
 
-def LOGV(*args):
-    log(*args, level=VERBOSE)
+def LOGV(*args, **fields):
+    if VERBOSE >= _gLogLevel:
+        log(*args, level=VERBOSE, **fields)
 
 
 # Colors for terminal output
@@ -222,41 +986,161 @@ highlight_colors = [
 reset_color = "\033[0m"  # Reset color
 
 
+def _rebind(func, old, new):
+    """
+    Replace old by new where func is defined (module or class, by qualified name)
+    and in modules that imported it by name.
+    """
+    module = sys.modules.get(func.__module__)
+    if module is None:
+        return
+    path = func.__qualname__.split(".")
+    owner = module
+    for part in path[:-1]:
+        owner = getattr(owner, part, None)
+        if owner is None:
+            return
+    name = path[-1]
+    current = vars(owner).get(name)
+    if isinstance(current, (staticmethod, classmethod)):
+        if current.__func__ is old:
+            setattr(owner, name, type(current)(new))
+    elif current is old:
+        setattr(owner, name, new)
+    if owner is module:
+        for other in list(sys.modules.values()):
+            if getattr(other, "__dict__", {}).get(name) is old:
+                setattr(other, name, new)
+
+
 def log_entry_exit(func):
     """
     Decorator to automatically log function entry and exit with arguments and return value.
+    In profiling mode it also records the wall and CPU time of every call.
+    While entry-exit logging and profiling are off, the plain function is installed,
+    so decorated calls cost nothing; set_entry_log() and set_profile() swap the
+    traced version in and out.
     """
 
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        if _gEntryExitLog:
-            global _gCallDepth
-            func_color = highlight_colors[_gCallDepth % len(highlight_colors)]
-            indent = "    " * _gCallDepth
+    if asyncio.iscoroutinefunction(func):
 
-            # Log function entry
-            console_entry_message = f"{indent}==> {entry_color}Entry: {func_color}{func.__name__}{reset_color}():"  # with args: {args}, kwargs: {kwargs}"
-            print(console_entry_message)
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not _gEntryExitLog:
+                return await _acall(func, args, kwargs)
+            state = _trace_enter(func)
+            try:
+                result = await _acall(func, args, kwargs)
+            finally:
+                _gTraceContext.reset(state[0])
+            _trace_exit(func, state)
+            return result
 
-            file_entry_message = f"{indent}==> Entry: {func.__name__}():"  # with args: {args}, kwargs: {kwargs}"
-            logee(file_entry_message)
+    elif inspect.isgeneratorfunction(func):
 
-            _gCallDepth += 1
-            result = func(*args, **kwargs)
-            _gCallDepth -= 1
+        # Trace and time the iteration, not only the creation of the generator
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _gEntryExitLog:
+                return (yield from _iterate(func, args, kwargs))
+            state = _trace_enter(func)
+            try:
+                result = yield from _iterate(func, args, kwargs)
+            finally:
+                _gTraceContext.reset(state[0])
+            _trace_exit(func, state)
+            return result
 
-            indent = "    " * _gCallDepth
+    else:
 
-            # Log function exit
-            console_exit_message = f"{indent}<== {exit_color}Exit: {func_color}{func.__name__}{reset_color}():"  # returning: {result}"
-            print(console_exit_message)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _gEntryExitLog:
+                return _call(func, args, kwargs)
+            state = _trace_enter(func)
+            try:
+                result = _call(func, args, kwargs)
+            finally:
+                _gTraceContext.reset(state[0])
+            _trace_exit(func, state)
+            return result
+
+    if "<locals>" in func.__qualname__:
+        # Nested functions cannot be swapped later, keep the checking wrapper
+        return wrapper
+    _gTracedFunctions.append((func, wrapper))
+    return wrapper if _gWrappersInstalled else func
 
-            file_exit_message = (
-                f"{indent}<== Exit: {func.__name__}():"  # returning: {result}"
-            )
-            logee(file_exit_message)
-        else:
-            result = func(*args, **kwargs)
-        return result
 
-    return wrapper
+def _trace_enter(func):
+    """
+    Log the entry of a call and open its span in the current thread/task context.
+    Returns the state _trace_exit() needs; state[0] resets the context.
+    """
+    # Depth and ids live in the context of the current thread/task
+    depth, parent_id, correlation_id, account = _gTraceContext.get() or (0, None, None, None)
+    span_id = f"{_gPid}-{next(_gSpanIds)}"
+    func_color = highlight_colors[depth % len(highlight_colors)]
+    indent = "    " * depth
+    span = f" span={span_id} parent={parent_id or '-'}"
+    fields = {"span": span_id, "parent": parent_id, **_context_fields()}
+
+    # Log function entry
+    console_entry_message = f"{indent}==> {entry_color}Entry: {func_color}{func.__name__}{reset_color}():"  # with args: {args}, kwargs: {kwargs}"
+    file_entry_message = f"{indent}==> Entry: {func.__name__}():{span}"  # with args: {args}, kwargs: {kwargs}"
+    logee(file_entry_message, console_message=console_entry_message, fields=fields, stacklevel=3)
+
+    token = _gTraceContext.set((depth + 1, span_id, correlation_id, account))
+    return token, indent, func_color, span, fields
+
+
+def _trace_exit(func, state):
+    """
+    Log the exit of a call opened with _trace_enter().
+    """
+    _, indent, func_color, span, fields = state
+
+    # Log function exit
+    console_exit_message = f"{indent}<== {exit_color}Exit: {func_color}{func.__name__}{reset_color}():"  # returning: {result}"
+    file_exit_message = f"{indent}<== Exit: {func.__name__}():{span}"  # returning: {result}"
+    logee(file_exit_message, console_message=console_exit_message, fields=fields, stacklevel=3)
+
+
+def _call(func, args, kwargs):
+    """
+    Call func, timing it when profiling is on.
+    """
+    if not _gProfile:
+        return func(*args, **kwargs)
+    frame = _gProfiler.enter(func.__qualname__)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _gProfiler.exit(frame)
+
+
+def _iterate(func, args, kwargs):
+    """
+    Iterate the generator of func, timing it when profiling is on; the wall time
+    spans the whole iteration, the consumer's work between items included.
+    """
+    if not _gProfile:
+        return (yield from func(*args, **kwargs))
+    frame = _gProfiler.enter(func.__qualname__)
+    try:
+        return (yield from func(*args, **kwargs))
+    finally:
+        _gProfiler.exit(frame)
+
+
+async def _acall(func, args, kwargs):
+    """
+    Await func, timing it when profiling is on; the wall time includes the awaits.
+    """
+    if not _gProfile:
+        return await func(*args, **kwargs)
+    frame = _gProfiler.enter(func.__qualname__)
+    try:
+        return await func(*args, **kwargs)
+    finally:
+        _gProfiler.exit(frame)
@@ -0,0 +1,191 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+class CallProfiler:
+    """
+    Per-call wall and CPU time recorder behind the log_entry_exit decorator.
+    Keeps per-function counts, totals and latency samples, and self time per
+    call stack (thread name first) for the call tree and flamegraph export.
+    The open calls are kept per context, so async calls interleaving on one
+    thread each see their own stack.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        # Tuple of the open frames; immutable, so tasks and threads that copy
+        # the context never share a stack
+        self._frames: contextvars.ContextVar = contextvars.ContextVar(
+            "profiler_frames", default=()
+        )
+        self._lock = threading.Lock()
+        # name -> [calls, wall ns, cpu ns, self ns, max ns, wall samples]
+        self._functions: Dict[str, list] = {}
+        # call stack -> [calls, wall ns, self ns]
+        self._stacks: Dict[Tuple[str, ...], list] = {}
+
+    def enter(self, name: str) -> list:
+        """
+        Start timing a call; pass the returned frame to exit().
+        """
+        # [name, wall start, cpu start, wall time spent in decorated children, context token]
+        frame = [name, time.perf_counter_ns(), time.thread_time_ns(), 0, None]
+        frame[4] = self._frames.set(self._frames.get() + (frame,))
+        return frame
+
+    def exit(self, frame: list) -> None:
+        """
+        Stop timing a call started with enter() and record it.
+        """
+        wall = time.perf_counter_ns() - frame[1]
+        cpu = time.thread_time_ns() - frame[2]
+        path = (threading.current_thread().name,) + tuple(f[0] for f in self._frames.get())
+        self._frames.reset(frame[4])
+        frames = self._frames.get()
+        if frames:
+            frames[-1][3] += wall
+        self_time = max(0, wall - frame[3])
+        with self._lock:
+            stats = self._functions.get(frame[0])
+            if stats is None:
+                stats = self._functions[frame[0]] = [0, 0, 0, 0, 0, []]
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+            stats[3] += self_time
+            stats[4] = max(stats[4], wall)
+            samples = stats[5]
+            if len(samples) < self.max_samples:
+                samples.append(wall)
+            else:
+                # Reservoir sampling keeps percentiles unbiased with bounded memory
+                idx = random.randrange(stats[0])
+                if idx < self.max_samples:
+                    samples[idx] = wall
+            node = self._stacks.get(path)
+            if node is None:
+                node = self._stacks[path] = [0, 0, 0]
+            node[0] += 1
+            node[1] += wall
+            node[2] += self_time
+
+    def reset(self) -> None:
+        """
+        Drop everything recorded so far.
+        """
+        with self._lock:
+            self._functions.clear()
+            self._stacks.clear()
+
+    def summary(self) -> List[Dict]:
+        """
+        Return per-function statistics in ms, the most expensive (total wall time) first.
+        """
+        with self._lock:
+            items = [(name, list(stats)) for name, stats in self._functions.items()]
+        rows = []
+        for name, (calls, wall, cpu, self_time, max_wall, samples) in items:
+            samples = sorted(samples)
+            rows.append(
+                {
+                    "function": name,
+                    "calls": calls,
+                    "total_ms": wall / 1e6,
+                    "self_ms": self_time / 1e6,
+                    "cpu_ms": cpu / 1e6,
+                    "mean_ms": wall / calls / 1e6,
+                    "p50_ms": _percentile(samples, 50) / 1e6,
+                    "p90_ms": _percentile(samples, 90) / 1e6,
+                    "p99_ms": _percentile(samples, 99) / 1e6,
+                    "max_ms": max_wall / 1e6,
+                }
+            )
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+
+    def format_summary(self) -> str:
+        """
+        Return the summary as a text table.
+        """
+        columns = [
+            "calls",
+            "total_ms",
+            "self_ms",
+            "cpu_ms",
+            "mean_ms",
+            "p50_ms",
+            "p90_ms",
+            "p99_ms",
+            "max_ms",
+        ]
+        rows = self.summary()
+        width = max([len("function")] + [len(row["function"]) for row in rows])
+        lines = [f"{'function':<{width}} " + " ".join(f"{c:>10}" for c in columns)]
+        for row in rows:
+            values = [f"{row['calls']:>10}"] + [f"{row[c]:>10.3f}" for c in columns[1:]]
+            lines.append(f"{row['function']:<{width}} " + " ".join(values))
+        return "\n".join(lines)
+
+    def format_tree(self) -> str:
+        """
+        Return the call tree per thread with calls and total wall time (ms) per call path.
+        """
+        with self._lock:
+            stacks = {path: list(node) for path, node in self._stacks.items()}
+        lines = []
+        emitted = set()
+        # Sorted paths put every parent right before its children
+        for path in sorted(stacks):
+            for depth in range(1, len(path) + 1):
+                prefix = path[:depth]
+                if prefix in emitted:
+                    continue
+                emitted.add(prefix)
+                line = "    " * (depth - 1) + prefix[-1]
+                if prefix in stacks:
+                    calls, wall, _ = stacks[prefix]
+                    line += f"  calls={calls} total={wall / 1e6:.3f}ms"
+                lines.append(line)
+        return "\n".join(lines)
+
+    def collapsed_stacks(self) -> str:
+        """
+        Return self time per stack in collapsed format ("a;b;c <microseconds>") for flamegraph tools.
+        """
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return "\n".join(
+            f"{';'.join(path)} {self_time // 1000}"
+            for path, (_, _, self_time) in stacks
+            if self_time // 1000 > 0
+        )
+
+    def write_reports(self, prefix: str) -> List[str]:
+        """
+        Write <prefix>.txt (summary table and call tree) and <prefix>.collapsed; return the paths.
+        """
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        report_path = prefix + ".txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(self.format_summary() + "\n\nCall tree:\n" + self.format_tree() + "\n")
+        collapsed_path = prefix + ".collapsed"
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed_stacks() + "\n")
+        return [report_path, collapsed_path]
+
+
+def _percentile(samples: List[int], percent: float) -> float:
+    """
+    Return the nearest-rank percentile of sorted samples.
+    """
+    if not samples:
+        return 0.0
+    idx = min(len(samples) - 1, max(0, int(round(percent / 100 * len(samples))) - 1))
+    return samples[idx]
+